@@ -0,0 +1,82 @@
+from KaspaCache import CacheDB
+import NewKaspAPI
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Compare l'ancien stockage des transactions (JSON brut, une ligne par transaction) au schéma
+# normalisé tx/tx_input/tx_output (adresses internées, montants entiers en sompi) :
+# place occupée, temps d'écriture et de relecture du résumé, sur un échantillon du cache.
+
+def load_sample(path,sample):
+    # Transactions brutes d'un ancien cache (table transactions, avant migration) si elles y sont ;
+    # sinon celles du schéma normalisé, remises au format de l'API avec les seuls champs lus par
+    # get_inputs_ouputs (le JSON de l'API est bien plus verbeux : taille JSON alors minorée)
+    with CacheDB(path,readonly=True) as db:
+        if db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'").fetchone():
+            return [json.loads(data) for (data,) in db.execute('SELECT data FROM transactions LIMIT ?',(sample,)).fetchall()]
+        addresses=dict(db.execute('SELECT id,address FROM addresses').fetchall())
+        transacs=[]
+        for transac_hash,block_time in db.execute('SELECT hash,block_time FROM tx LIMIT ?',(sample,)).fetchall():
+            inputs=db.execute('SELECT address_id,amount,prev_hash,prev_idx FROM tx_input WHERE tx_hash = ? ORDER BY idx',(transac_hash,)).fetchall()
+            outputs=db.execute('SELECT idx,address_id,amount FROM tx_output WHERE tx_hash = ? ORDER BY idx',(transac_hash,)).fetchall()
+            transacs.append({"hash":transac_hash,"block_time":block_time,
+                             "inputs":[{"previous_outpoint_hash":prev_hash,"previous_outpoint_index":str(prev_idx),
+                                        "previous_outpoint_address":addresses.get(addr_id),"previous_outpoint_amount":amount}
+                                       for addr_id,amount,prev_hash,prev_idx in inputs],
+                             "outputs":[{"index":idx,"script_public_key_address":addresses.get(addr_id),"amount":amount}
+                                        for idx,addr_id,amount in outputs]})
+    return transacs
+
+def timed(fn,repeat):
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        result=fn()
+        elapsed=time.perf_counter()-start
+        best=elapsed if best is None else min(best,elapsed)
+    return result,best
+
+def bench_json(path,transacs,repeat):
+    db=CacheDB(path,setup=lambda:db.execute('CREATE TABLE IF NOT EXISTS transactions (transac_hash TEXT PRIMARY KEY,data TEXT)'))
+    with db:
+        start=time.perf_counter()
+        db.executemany('INSERT OR IGNORE INTO transactions (transac_hash,data) VALUES (?,?)',
+                       [(NewKaspAPI.get_transac_hash(t),json.dumps(t)) for t in transacs])
+        db.flush()
+        t_write=time.perf_counter()-start
+        read=lambda: [NewKaspAPI.get_inputs_ouputs(json.loads(db.execute('SELECT data FROM transactions WHERE transac_hash = ?',(NewKaspAPI.get_transac_hash(t),)).fetchone()[0]))
+                      for t in transacs]
+        _,t_read=timed(read,repeat)
+        return db.used_size(),t_write,t_read
+
+def bench_rows(path,transacs,repeat):
+    # Même code que le cache (save_tx_db / get_inout_db), sur une base vide
+    NewKaspAPI.db.path=path
+    db=NewKaspAPI.db
+    with db:
+        start=time.perf_counter()
+        for transac in transacs:
+            NewKaspAPI.save_tx_db(transac)
+        db.flush()
+        t_write=time.perf_counter()-start
+        _,t_read=timed(lambda: [NewKaspAPI.get_inout_db(NewKaspAPI.get_transac_hash(t)) for t in transacs],repeat)
+        return db.used_size(),t_write,t_read
+
+def bench(transacs,repeat):
+    print(f"{len(transacs)} transactions")
+    print(f"{'stockage':<14}{'taille (Ko)':>12}{'octets/tx':>11}{'écriture (ms)':>15}{'relecture (ms)':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name,file,fn in (("json","json.db",bench_json),("tx_*","tx.db",bench_rows)):
+            size,t_write,t_read=fn(os.path.join(tmp,file),transacs,repeat)
+            print(f"{name:<14}{size/1024:>12.1f}{size/max(len(transacs),1):>11.1f}{t_write*1000:>15.1f}{t_read*1000:>16.1f}")
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Benchmark du stockage des transactions dans le cache")
+    parser.add_argument("--db",type=str,default="transacs_cache.db",help="Cache SQLite à échantillonner")
+    parser.add_argument("--sample",type=int,default=5000,help="Nombre de transactions lues")
+    parser.add_argument("--repeat",type=int,default=3,help="Nombre de répétitions de la relecture (meilleur temps retenu)")
+    args=parser.parse_args()
+    bench(load_sample(args.db,args.sample),args.repeat)
@@ -0,0 +1,68 @@
+from PyvisAugustinV3 import merge_transactions,calculate_risk_scores
+import argparse
+import gc
+import random
+import time
+
+# Temps d'agrégation par adresse dans PyvisAugustinV3 à mesure que le graphe grossit :
+# merge_transactions (nouvelles transactions seulement, sets) contre l'ancienne logique de
+# make_graph (re-parcours de tout `transac` et tests d'appartenance sur des listes).
+# La dernière colonne donne le temps de calculate_risk_scores sur le graphe courant, par nœud.
+
+def synthetic_transactions(rng, universe, nb_transacs):
+    # Même forme que la réponse /transactions de l'API kas.fyi
+    return [{"transactionId": f"{rng.getrandbits(64):016x}", "blockTime": 0,
+             "inputs": [{"previousOutput": {"scriptPublicKeyAddress": a, "amount": "100000000"}}
+                        for a in rng.sample(universe, 2)],
+             "outputs": [{"scriptPublicKeyAddress": a, "amount": "50000000"} for a in rng.sample(universe, 3)]}
+            for _ in range(nb_transacs)]
+
+def legacy_merge(transac, transactions, allAddresses):
+    # Ancienne version : agrégation puis re-parcours complet de `transac`, allAddresses en liste
+    merge_transactions(transac, transactions, set())
+    addresses = []
+    for income in transac:
+        if income not in addresses and income not in allAddresses:
+            addresses.append(income)
+        for outcome in transac[income]:
+            if outcome not in addresses and outcome not in allAddresses:
+                addresses.append(outcome)
+    return addresses
+
+def bench(nb_addresses, nb_transacs, step, legacy, seed):
+    rng = random.Random(seed)
+    universe = [f"kaspa:q{i:061d}" for i in range(nb_addresses * 4)]
+    # Les contreparties de la i-ème adresse sont tirées parmi les 4*(i+2) premières : le graphe
+    # grossit régulièrement, comme lors d'un parcours par cercles
+    histories = [synthetic_transactions(rng, universe[:4 * (i + 2)], nb_transacs) for i in range(nb_addresses)]
+    transac = {}
+    allAddresses = set()
+    elapsed = 0.0
+    # Comme timeit : pas de passage du ramasse-miettes pendant les mesures
+    gc.disable()
+    print(f"{'adresses':>9}{'nœuds':>9}{'µs / adresse':>15}{'score µs / nœud':>18}")
+    for i, transactions in enumerate(histories, 1):
+        start = time.perf_counter()
+        if legacy:
+            outcomes = legacy_merge(transac, transactions, list(allAddresses))
+        else:
+            outcomes = merge_transactions(transac, transactions, allAddresses)
+        elapsed += time.perf_counter() - start
+        allAddresses.update(outcomes)
+        if i % step == 0:
+            start = time.perf_counter()
+            calculate_risk_scores(allAddresses, transac, {})
+            scoring = (time.perf_counter() - start) / max(len(allAddresses), 1)
+            print(f"{i:>9}{len(allAddresses):>9}{elapsed / step * 1e6:>15.1f}{scoring * 1e6:>18.2f}")
+            elapsed = 0.0
+    gc.enable()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de l'agrégation incrémentale de PyvisAugustinV3")
+    parser.add_argument("--addresses", type=int, default=5000, help="Nombre d'adresses traitées")
+    parser.add_argument("--transacs", type=int, default=20, help="Transactions par adresse")
+    parser.add_argument("--step", type=int, default=500, help="Intervalle d'affichage (en adresses)")
+    parser.add_argument("--legacy", action="store_true", help="Mesure l'ancienne logique (re-parcours complet) pour comparaison")
+    parser.add_argument("--seed", type=int, default=1, help="Graine du générateur")
+    args = parser.parse_args()
+    bench(args.addresses, args.transacs, args.step, args.legacy, args.seed)
@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Mesure le coût d'un `import` à froid (nouvel interpréteur à chaque fois, comme un noyau de
+# notebook ou un appel CLI court) et vérifie qu'il reste sans effet de bord : pas de fichier
+# de cache créé, pas de dépendance lourde chargée.
+
+HEAVY=("pyvis","requests","asyncio","networkx","IPython")
+
+PROBE="""
+import sys,time
+sys.path.insert(0,{root!r})
+start=time.perf_counter()
+import {module}
+print(time.perf_counter()-start)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+def run_once(module,cwd):
+    root=os.path.dirname(os.path.abspath(__file__))
+    out=subprocess.run([sys.executable,"-c",PROBE.format(root=root,module=module,heavy=HEAVY)],
+                       cwd=cwd,capture_output=True,text=True,check=True).stdout.splitlines()
+    return float(out[0]),[m for m in out[1].split(",") if m]
+
+def top_imports(module,cwd,top):
+    # Détail par module (python -X importtime), trié par temps cumulé
+    root=os.path.dirname(os.path.abspath(__file__))
+    err=subprocess.run([sys.executable,"-X","importtime","-c",f"import sys; sys.path.insert(0,{root!r}); import {module}"],
+                       cwd=cwd,capture_output=True,text=True,check=True).stderr
+    rows=[]
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _,cumulative,name=line[len("import time:"):].split("|")
+        if not name.startswith("  ") and name.strip()!=module:
+            # autre module de premier niveau (site, encodings... au démarrage de l'interpréteur) :
+            # lui et ses sous-modules, listés avant lui, ne concernent pas l'import mesuré
+            rows=[]
+            continue
+        rows.append((int(cumulative),name.rstrip()))
+    return sorted(rows,reverse=True)[:top]
+
+def bench(modules,repeat,top):
+    for module in modules:
+        with tempfile.TemporaryDirectory() as cwd:
+            times=[]
+            for _ in range(repeat):
+                elapsed,heavy=run_once(module,cwd)
+                times.append(elapsed)
+            created=os.listdir(cwd)
+            print(f"{module} : meilleur {min(times)*1000:.1f} ms, médian {sorted(times)[len(times)//2]*1000:.1f} ms ({repeat} imports)")
+            print(f"  dépendances lourdes chargées : {', '.join(heavy) or 'aucune'}")
+            print(f"  fichiers créés : {', '.join(created) or 'aucun'}")
+            if top:
+                for cumulative,name in top_imports(module,cwd,top):
+                    print(f"  {cumulative/1000:>8.1f} ms {name}")
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Benchmark du temps d'import des scripts")
+    parser.add_argument("modules",nargs="*",default=["NewKaspAPI"],help="Modules à importer (défaut : NewKaspAPI)")
+    parser.add_argument("--repeat",type=int,default=5,help="Nombre d'imports à froid (meilleur et médian retenus)")
+    parser.add_argument("--top",type=int,default=10,help="Nombre de modules détaillés via -X importtime (0 = aucun)")
+    args=parser.parse_args()
+    bench(args.modules,args.repeat,args.top)
@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+
+# Export colonnaire (CSR) du graphe `relations` de NewKaspAPI : un fichier .npy par tableau dans
+# un dossier, relisible en mémoire partagée (np.load(mmap_mode="r")) sans re-parcours ni HTML.
+#
+# Nœuds : d'abord les adresses explorées (ordre de `relations`), puis leurs contreparties non
+# explorées (cercle = -1, aucune arête sortante dans le CSR).
+# Pour chaque sens ("out" = address_out, "in" = address_in) : {sens}_offsets (n+1), puis
+# {sens}_neighbors / {sens}_amount (sompi) / {sens}_count (nb de transactions), arête par arête.
+# Les arêtes du nœud i sont aux positions offsets[i]:offsets[i+1].
+
+CSR_VERSION=1
+SOMPI=100000000
+
+
+def to_sompi(amounts):
+    # Montants de relations (KAS, flottants) -> entiers en sompi
+    return np.rint(np.asarray(amounts,dtype=np.float64)*SOMPI).astype(np.int64)
+
+
+def relations_to_csr(relations,lookup=None):
+    # relations : clés = identifiants (ou adresses) ; lookup(clé) -> adresse, pour le tableau "address"
+    nodes=list(relations)
+    index={node:i for i,node in enumerate(nodes)}
+    for data in relations.values():
+        for side in ("address_out","address_in"):
+            for node in data[side]:
+                if node not in index:
+                    index[node]=len(nodes)
+                    nodes.append(node)
+    explored=[relations[node] for node in nodes[:len(relations)]]
+    nb_nodes=len(nodes)
+
+    addresses=[(lookup(node) if lookup else node).encode() for node in nodes]
+    arrays={"address":np.array(addresses,dtype=f"S{max(map(len,addresses),default=1)}")}
+    if all(isinstance(node,int) for node in nodes):
+        arrays["address_id"]=np.array(nodes,dtype=np.int64)
+
+    cercle=np.full(nb_nodes,-1,dtype=np.int16)
+    cercle[:len(explored)]=[data["cercle"] for data in explored]
+    arrays["cercle"]=cercle
+    for side in ("in","out"):
+        totals=np.zeros(nb_nodes,dtype=np.int64)
+        totals[:len(explored)]=to_sompi([data[f"amount_{side}"] for data in explored])
+        arrays[f"amount_{side}"]=totals
+        nb=np.zeros(nb_nodes,dtype=np.int64)
+        nb[:len(explored)]=[data[f"nb_transacs_{side}"] for data in explored]
+        arrays[f"nb_transacs_{side}"]=nb
+
+        degrees=np.zeros(nb_nodes,dtype=np.int64)
+        degrees[:len(explored)]=[len(data[f"address_{side}"]) for data in explored]
+        offsets=np.zeros(nb_nodes+1,dtype=np.int64)
+        np.cumsum(degrees,out=offsets[1:])
+        edges=[(index[node],info["amount"],info["nb"]) for data in explored for node,info in data[f"address_{side}"].items()]
+        neighbors,amounts,counts=zip(*edges) if edges else ((),(),())
+        arrays[f"{side}_offsets"]=offsets
+        arrays[f"{side}_neighbors"]=np.array(neighbors,dtype=np.int32 if nb_nodes<2**31 else np.int64)
+        arrays[f"{side}_amount"]=to_sompi(amounts)
+        arrays[f"{side}_count"]=np.array(counts,dtype=np.int64)
+    return arrays
+
+
+def save_csr(path,arrays,**meta):
+    # meta (adresse initiale, nb de cercles, limite...) va dans meta.json
+    os.makedirs(path,exist_ok=True)
+    for name,array in arrays.items():
+        np.save(os.path.join(path,f"{name}.npy"),array)
+    meta={"version":CSR_VERSION,"nb_nodes":len(arrays["cercle"]),"nb_explored":int((arrays["cercle"]>=0).sum()),
+          "nb_edges_out":len(arrays["out_neighbors"]),"nb_edges_in":len(arrays["in_neighbors"]),"arrays":sorted(arrays),**meta}
+    with open(os.path.join(path,"meta.json"),"w") as f:
+        json.dump(meta,f,indent=2)
+    return meta
+
+
+def load_csr(path,mmap_mode="r"):
+    # mmap_mode=None pour tout charger en mémoire
+    with open(os.path.join(path,"meta.json")) as f:
+        meta=json.load(f)
+    if meta.get("version")!=CSR_VERSION:
+        raise ValueError(f"Version d'export CSR inconnue : {meta.get('version')}")
+    arrays={name:np.load(os.path.join(path,f"{name}.npy"),mmap_mode=mmap_mode) for name in meta["arrays"]}
+    return arrays,meta
+
+
+def csr_to_relations(arrays):
+    # Inverse de relations_to_csr (clés = adresses, montants en KAS) : de quoi relancer
+    # risk_score ou create_vis sans re-parcourir. Les montants repassent par le sompi.
+    addresses=[a.decode() for a in arrays["address"]]
+    relations={}
+    for i in np.flatnonzero(np.asarray(arrays["cercle"])>=0):
+        data={"cercle":int(arrays["cercle"][i])}
+        for side in ("in","out"):
+            start,end=arrays[f"{side}_offsets"][i],arrays[f"{side}_offsets"][i+1]
+            data[f"nb_transacs_{side}"]=int(arrays[f"nb_transacs_{side}"][i])
+            data[f"amount_{side}"]=int(arrays[f"amount_{side}"][i])/SOMPI
+            data[f"address_{side}"]={addresses[j]:{"nb":int(nb),"amount":int(amount)/SOMPI}
+                                     for j,amount,nb in zip(arrays[f"{side}_neighbors"][start:end],
+                                                            arrays[f"{side}_amount"][start:end],
+                                                            arrays[f"{side}_count"][start:end])}
+        relations[addresses[i]]=data
+    return relations
@@ -0,0 +1,349 @@
+import atexit
+import functools
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+# Réglages appliqués à chaque connexion (journal WAL : les lecteurs ne bloquent pas l'écrivain)
+PRAGMAS={
+    "synchronous":"NORMAL",
+    "temp_store":"MEMORY",
+    "cache_size":-65536,
+    "mmap_size":268435456,
+}
+
+# Marqueurs de la file d'écriture différée
+COMMIT=object()
+STOP=object()
+# Table modifiée par une écriture mise en file (None : inconnue, toute lecture attend alors la file)
+WRITE_TABLE=re.compile(r"\s*(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)",re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def written_table(sql):
+    match=WRITE_TABLE.match(sql)
+    return match.group(1).lower() if match else None
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_names(sql):
+    # Mots d'une requête, parmi lesquels les tables qu'elle lit
+    return frozenset(re.findall(r"\w+",sql.lower()))
+
+
+class AddressIndex:
+    """Dictionnaire adresse <-> identifiant entier dense (à partir de 1).
+
+    Sans `db`, les identifiants ne vivent qu'en mémoire ; avec un CacheDB, ils sont persistés
+    dans la table addresses et donc partagés entre exécutions et entre workers. Le cache mémoire
+    est vidé à chaque rollback de `db`, qui peut annuler des identifiants tout juste insérés.
+    """
+
+    def __init__(self,db=None):
+        self.db=db
+        self.ids={}
+        self.addresses={}
+        if db is not None:
+            db.on_rollback.append(self.clear)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def id(self,address):
+        address_id=self.ids.get(address)
+        if address_id is None:
+            if self.db is None:
+                address_id=len(self.ids)+1
+            else:
+                # INSERT OR IGNORE puis SELECT : sûr si un autre processus vient d'insérer la même adresse
+                self.db.execute('INSERT OR IGNORE INTO addresses (address) VALUES (?)',(address,))
+                address_id=self.db.execute('SELECT id FROM addresses WHERE address = ?',(address,)).fetchone()[0]
+            self.ids[address]=address_id
+            self.addresses[address_id]=address
+        return address_id
+
+    def address(self,address_id):
+        address=self.addresses.get(address_id)
+        if address is None:
+            if self.db is None:
+                raise KeyError(address_id)
+            address=self.db.execute('SELECT address FROM addresses WHERE id = ?',(address_id,)).fetchone()[0]
+            self.ids[address]=address_id
+            self.addresses[address_id]=address
+        return address
+
+    def clear(self):
+        # Appelé après un rollback : des identifiants non validés ont pu être mis en mémoire
+        self.ids.clear()
+        self.addresses.clear()
+
+
+class CacheDB:
+    """Connexion au cache SQLite : mode WAL, pragmas réglés, écritures regroupées par transaction.
+
+    Un seul processus écrivain à la fois (les autres attendent jusqu'à `timeout`), autant de
+    lecteurs que l'on veut (readonly=True). commit() ne valide réellement qu'une fois tous les
+    `batch_size` appels ou toutes les `batch_interval` secondes ; flush() valide tout de suite.
+    Un lot ne doit jamais couvrir un appel réseau, qui garderait le verrou d'écriture (et donc
+    bloquerait les autres processus) pendant la requête : release() le termine juste avant. Seul le
+    thread qui a ouvert la connexion (celui qui écrit) termine ainsi le lot : appelé depuis un thread
+    qui ne fait que des requêtes HTTP, release() ne coupe pas un lot en cours d'écriture.
+    La connexion s'ouvre d'elle-même à la première requête ; `setup` (création du schéma,
+    migrations) est alors appelé une fois, connexion ouverte.
+
+    Après start_writer(), write()/write_many() sont mises en file et exécutées par un thread
+    dédié sur la même connexion, pendant que le thread appelant continue (appels réseau).
+    Une lecture n'attend la file que si elle porte sur une table qui y a des écritures : on relit
+    toujours ses propres écritures. Pour les lectures qui suivent chaque écriture, write_many()
+    peut publier les lignes en file dans `overlay` (clé -> valeur, cf. queued()) : l'appelant
+    les y relit puis lit la base avec wait=False, sans attendre le thread d'écriture.
+    """
+
+    def __init__(self,path,readonly=False,batch_size=50,batch_interval=5.0,timeout=60,setup=None):
+        self.path=path
+        self.readonly=readonly
+        self.batch_size=batch_size
+        self.batch_interval=batch_interval
+        self.timeout=timeout
+        self.setup=setup
+        self.conn=None
+        self.cursor=None
+        self.owner=None
+        self.pending=0
+        self.last_flush=time.monotonic()
+        self.lock=threading.RLock()
+        self.queue=None
+        self.writer=None
+        self.writer_error=None
+        # Écritures en file par table, et lignes publiées par write_many(overlay=...)
+        self.dirty={}
+        self.overlay={}
+        self.dirty_lock=threading.Lock()
+        # Appelés après chaque rollback (caches mémoire de lignes qui viennent d'être annulées)
+        self.on_rollback=[]
+
+    def open(self):
+        if self.conn is not None:
+            return self
+        if self.readonly:
+            self.conn=sqlite3.connect(f"file:{self.path}?mode=ro",uri=True,timeout=self.timeout)
+        else:
+            # BEGIN IMMEDIATE : le verrou d'écriture est pris dès la première écriture de la transaction,
+            # ce qui évite les "database is locked" en cours de transaction entre deux processus.
+            # Connexion partagée avec le thread d'écriture (accès sérialisés par self.lock)
+            self.conn=sqlite3.connect(self.path,timeout=self.timeout,isolation_level="IMMEDIATE",check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        for name,value in PRAGMAS.items():
+            self.conn.execute(f"PRAGMA {name}={value}")
+        self.cursor=self.conn.cursor()
+        self.owner=threading.current_thread()
+        self.pending=0
+        self.last_flush=time.monotonic()
+        if self.setup is not None:
+            self.setup()
+        return self
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.stop_writer()
+        self.flush()
+        if not self.readonly:
+            try:
+                self.conn.execute("PRAGMA optimize")
+            except sqlite3.OperationalError:
+                pass
+        self.conn.close()
+        self.conn=None
+        self.cursor=None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self,exc_type,exc,tb):
+        if exc_type is not None and self.conn is not None:
+            self.rollback()
+        self.close()
+
+    def execute(self,sql,params=(),wait=True):
+        # Curseur partagé (comme l'ancien `cursor` global) : à lire avant la requête suivante
+        self.open()
+        if wait:
+            self.wait_for(sql)
+        with self.lock:
+            return self.cursor.execute(sql,params)
+
+    def executemany(self,sql,rows):
+        self.open().wait_for(sql)
+        with self.lock:
+            return self.cursor.executemany(sql,rows)
+
+    def query(self,sql,params=(),wait=True):
+        # Curseur dédié, pour itérer pendant que le curseur partagé sert à d'autres requêtes
+        self.open()
+        if wait:
+            self.wait_for(sql)
+        with self.lock:
+            return self.conn.execute(sql,params)
+
+    def write(self,sql,params=(),overlay=None):
+        # Écriture sans résultat attendu : différée si le thread d'écriture tourne
+        self.write_many(sql,[params],overlay)
+
+    def write_many(self,sql,rows,overlay=None):
+        if self.writer is None:
+            self.executemany(sql,rows)
+            return
+        self.check_writer()
+        table=written_table(sql)
+        with self.dirty_lock:
+            self.dirty[table]=self.dirty.get(table,0)+1
+            if overlay:
+                self.overlay.update(overlay)
+        self.queue.put((sql,rows,table,overlay))
+
+    def queued(self,key):
+        # Valeur publiée par write_many(overlay=...) tant que l'écriture est en file, sinon None
+        return self.overlay.get(key)
+
+    def start_writer(self,queue_size=10000):
+        # File bornée : si le disque ne suit pas, les appelants attendent au lieu d'accumuler
+        if self.writer is not None:
+            return self
+        self.open()
+        self.queue=queue.Queue(queue_size)
+        self.writer_error=None
+        self.writer=threading.Thread(target=self._write_loop,name="CacheDB-writer",daemon=True)
+        self.writer.start()
+        # Vidage de la file à la sortie de l'interpréteur, même sans close()
+        atexit.register(self.stop_writer)
+        return self
+
+    def stop_writer(self):
+        if self.writer is None:
+            return
+        self.queue.put(STOP)
+        self.writer.join()
+        self.writer=None
+        atexit.unregister(self.stop_writer)
+        self.check_writer()
+
+    def wait_for(self,sql):
+        # Attend la file seulement si la requête touche une table qui y a des écritures
+        with self.dirty_lock:
+            busy=self.dirty and (None in self.dirty or not sql_names(sql).isdisjoint(self.dirty))
+        if busy:
+            self.drain()
+
+    def drain(self):
+        # Attend que toutes les écritures en file soient passées sur la connexion
+        if self.writer is not None and threading.current_thread() is not self.writer:
+            self.queue.join()
+            self.check_writer()
+
+    def check_writer(self):
+        if self.writer_error is not None:
+            error,self.writer_error=self.writer_error,None
+            raise error
+
+    def _write_loop(self):
+        stop=False
+        while not stop:
+            # Regroupe tout ce qui attend déjà dans la file sous un seul verrou
+            items=[self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.lock:
+                    for item in items:
+                        if item is STOP:
+                            stop=True
+                        elif self.writer_error is not None:
+                            # après une erreur, la suite de la file n'a plus de sens
+                            continue
+                        elif item is COMMIT:
+                            self._commit()
+                        else:
+                            self.conn.executemany(item[0],item[1])
+            except Exception as e:
+                # Remontée au thread appelant à sa prochaine lecture ou écriture
+                self.writer_error=e
+            finally:
+                with self.dirty_lock:
+                    for item in items:
+                        if isinstance(item,tuple):
+                            self._done(*item[2:])
+                for _ in items:
+                    self.queue.task_done()
+
+    def _done(self,table,overlay):
+        # Écriture passée sur la connexion : la table et les lignes publiées redeviennent lisibles en base
+        self.dirty[table]-=1
+        if not self.dirty[table]:
+            del self.dirty[table]
+        for key,value in (overlay or {}).items():
+            if self.overlay.get(key) is value:
+                del self.overlay[key]
+
+    def _commit(self):
+        if self.conn is not None and self.conn.in_transaction:
+            self.conn.commit()
+
+    def commit(self):
+        self.pending+=1
+        if self.pending>=self.batch_size or time.monotonic()-self.last_flush>=self.batch_interval:
+            self.release()
+
+    def release(self):
+        # Termine la transaction en cours sans attendre la file : à appeler avant tout appel
+        # bloquant (réseau), pour ne jamais garder le verrou d'écriture du fichier pendant ce temps
+        if threading.current_thread() is not self.owner:
+            return
+        if self.writer is not None:
+            # Validation faite par le thread d'écriture, dans l'ordre de la file
+            self.check_writer()
+            self.queue.put(COMMIT)
+        elif self.conn is not None:
+            with self.lock:
+                self._commit()
+        self.pending=0
+        self.last_flush=time.monotonic()
+
+    def flush(self):
+        self.drain()
+        with self.lock:
+            self._commit()
+        self.pending=0
+        self.last_flush=time.monotonic()
+
+    def size(self):
+        # Taille du fichier en octets (hors WAL), pages libres comprises
+        self.open()
+        return self.conn.execute("PRAGMA page_count").fetchone()[0]*self.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def used_size(self):
+        # Octets occupés par des données : sans les pages libérées par les DELETE (avant VACUUM)
+        self.open()
+        pages=self.conn.execute("PRAGMA page_count").fetchone()[0]-self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages*self.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def vacuum(self):
+        # Réécrit le fichier pour rendre la place libérée (hors transaction)
+        self.open().flush()
+        self.conn.execute("VACUUM")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def rollback(self):
+        if self.conn is not None:
+            self.drain()
+            with self.lock:
+                self.conn.rollback()
+        self.pending=0
+        self.last_flush=time.monotonic()
+        for callback in self.on_rollback:
+            callback()
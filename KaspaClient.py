@@ -0,0 +1,252 @@
+import atexit
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zipfile
+from urllib.parse import urlsplit
+
+# requests n'est importé qu'à la première requête (ou ouverture d'archive) : importer ce
+# module, ou un script qui l'utilise, reste rapide
+
+# Débit autorisé par hôte : (requêtes par seconde, rafale max)
+RATE_LIMITS={
+    "api.kaspa.org":(10,20),
+    "api.kas.fyi":(4,8),
+}
+DEFAULT_RATE=(20,40)
+RETRY_STATUS={429,500,502,503,504}
+
+
+class TokenBucket:
+    def __init__(self,rate,capacity):
+        self.rate=rate
+        self.capacity=capacity
+        self.tokens=capacity
+        self.last=time.monotonic()
+        self.lock=threading.Lock()
+
+    def acquire(self):
+        """Prend un jeton, en attendant si besoin. Renvoie le temps d'attente (s)."""
+        with self.lock:
+            now=time.monotonic()
+            self.tokens=min(self.capacity,self.tokens+(now-self.last)*self.rate)
+            self.last=now
+            self.tokens-=1
+            wait=-self.tokens/self.rate if self.tokens<0 else 0
+        if wait>0:
+            time.sleep(wait)
+        return wait
+
+
+class ReplayMissError(Exception):
+    """Requête absente de l'archive en mode replay (aucun accès réseau n'est tenté)."""
+
+
+class HTTPArchive:
+    """Archive zip (deflate) des réponses API, une entrée par requête (clé = hash méthode+URL+corps)."""
+
+    def __init__(self,path,mode):
+        if mode not in ("record","replay"):
+            raise ValueError(f"Mode d'archive inconnu : {mode}")
+        self.path=path
+        self.mode=mode
+        self.zip=zipfile.ZipFile(path,"a" if mode=="record" else "r",compression=zipfile.ZIP_DEFLATED)
+        self.names=set(self.zip.namelist())
+        self.lock=threading.Lock()
+        self.search_index=None
+
+    @staticmethod
+    def key(request):
+        h=hashlib.sha256(f"{request.method} {request.url}\n".encode())
+        body=request.body or b""
+        h.update(body.encode() if isinstance(body,str) else body)
+        return h.hexdigest()+".json"
+
+    def record(self,request,response):
+        key=self.key(request)
+        entry={"method":request.method,"url":request.url,"status":response.status_code,
+               "headers":{"Content-Type":response.headers.get("Content-Type","")},
+               "body":response.content.decode("utf-8",errors="replace")}
+        with self.lock:
+            if key in self.names:
+                return
+            self.zip.writestr(key,json.dumps(entry))
+            self.names.add(key)
+
+    def replay(self,request):
+        import requests
+        key=self.key(request)
+        with self.lock:
+            entry=json.loads(self.zip.read(key)) if key in self.names else self.compose_search(request)
+        if entry is None:
+            raise ReplayMissError(f"Réponse absente de l'archive {self.path} : {request.method} {request.url}")
+        response=requests.models.Response()
+        response.status_code=entry["status"]
+        response.headers.update(entry["headers"])
+        response._content=entry["body"].encode("utf-8")
+        response.url=entry["url"]
+        response.request=request
+        return response
+
+    def compose_search(self,request):
+        # Recherche groupée (POST .../transactions/search) : la liste demandée dépend de ce que le
+        # cache contenait déjà, qui varie d'un parcours distribué à l'autre. On la recompose à partir
+        # des transactions renvoyées par les recherches enregistrées sur la même URL, à défaut des
+        # historiques d'adresses enregistrés (d'où viennent les transactions trouvées en cache).
+        if request.method!="POST" or not urlsplit(request.url).path.endswith("/transactions/search"):
+            return None
+        if self.search_index is None:
+            self.search_index={}
+            for name in self.names:
+                entry=json.loads(self.zip.read(name))
+                path=urlsplit(entry["url"]).path
+                if entry["status"]!=200:
+                    continue
+                if entry["method"]=="POST" and path.endswith("/transactions/search"):
+                    key=entry["url"]
+                elif entry["method"]=="GET" and path.endswith("/full-transactions"):
+                    key=None
+                else:
+                    continue
+                for transac in json.loads(entry["body"]):
+                    transac_hash=transac.get("verboseData",{}).get("transactionId") or transac.get("hash")
+                    self.search_index[(key,transac_hash)]=transac
+        ids=json.loads(request.body or b"{}").get("transactionIds",[])
+        transacs=[self.search_index.get((request.url,h)) or self.search_index.get((None,h)) for h in ids]
+        if not all(transacs):
+            return None
+        return {"method":request.method,"url":request.url,"status":200,"headers":{"Content-Type":"application/json"},
+                "body":json.dumps(transacs)}
+
+    def merge(self,path):
+        # Ajoute les réponses d'une autre archive (celle d'un worker) absentes de celle-ci
+        nb=0
+        with zipfile.ZipFile(path) as other,self.lock:
+            for name in other.namelist():
+                if name not in self.names:
+                    self.zip.writestr(name,other.read(name))
+                    self.names.add(name)
+                    nb+=1
+        return nb
+
+    def close(self):
+        with self.lock:
+            self.zip.close()
+
+
+class KaspaClient:
+    """Client HTTP partagé : sessions keep-alive par hôte, limite de débit, retry avec backoff."""
+
+    def __init__(self,timeout=30,max_retries=5,backoff=0.5,max_backoff=30,rate_limits=None):
+        self.timeout=timeout
+        self.max_retries=max_retries
+        self.backoff=backoff
+        self.max_backoff=max_backoff
+        self.rate_limits=dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.sessions={}
+        self.buckets={}
+        self.lock=threading.Lock()
+        self.stats={"requests":0,"retries":0,"errors":0,"throttle_waits":0,"throttle_time":0.0,"replayed":0}
+        self.archive=None
+
+    def open_archive(self,path,mode):
+        # mode "record" : enregistre chaque réponse ; mode "replay" : rejoue sans réseau
+        if self.archive:
+            self.archive.close()
+        self.archive=HTTPArchive(path,mode)
+        atexit.register(self.archive.close)
+
+    def _host(self,host):
+        with self.lock:
+            if host not in self.sessions:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session=requests.Session()
+                adapter=HTTPAdapter(pool_connections=4,pool_maxsize=32)
+                session.mount("http://",adapter)
+                session.mount("https://",adapter)
+                self.sessions[host]=session
+                self.buckets[host]=TokenBucket(*self.rate_limits.get(host,DEFAULT_RATE))
+            return self.sessions[host],self.buckets[host]
+
+    def _count(self,key,value=1):
+        with self.lock:
+            self.stats[key]+=value
+
+    def _delay(self,attempt,response=None):
+        retry_after=response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after),self.max_backoff)
+        # backoff exponentiel avec "full jitter"
+        return random.uniform(0,min(self.max_backoff,self.backoff*2**attempt))
+
+    def request(self,method,url,**kwargs):
+        if self.archive:
+            import requests
+            prepared=requests.Request(method,url,params=kwargs.get("params"),data=kwargs.get("data"),json=kwargs.get("json")).prepare()
+            if self.archive.mode=="replay":
+                self._count("replayed")
+                return self.archive.replay(prepared)
+        response=self._request(method,url,**kwargs)
+        if self.archive:
+            self.archive.record(prepared,response)
+        return response
+
+    def _request(self,method,url,**kwargs):
+        import requests
+        session,bucket=self._host(urlsplit(url).hostname)
+        kwargs.setdefault("timeout",self.timeout)
+        attempt=0
+        while True:
+            wait=bucket.acquire()
+            if wait>0:
+                self._count("throttle_waits")
+                self._count("throttle_time",wait)
+            self._count("requests")
+            try:
+                response=session.request(method,url,**kwargs)
+            except (requests.exceptions.ConnectionError,requests.exceptions.Timeout):
+                if attempt>=self.max_retries:
+                    self._count("errors")
+                    raise
+                response=None
+            else:
+                if response.status_code not in RETRY_STATUS or attempt>=self.max_retries:
+                    if response.status_code in RETRY_STATUS:
+                        self._count("errors")
+                    return response
+            self._count("retries")
+            time.sleep(self._delay(attempt,response))
+            attempt+=1
+
+    def get(self,url,**kwargs):
+        return self.request("GET",url,**kwargs)
+
+    def post(self,url,**kwargs):
+        return self.request("POST",url,**kwargs)
+
+    def report(self):
+        s=self.stats
+        return (f"Requêtes HTTP : {s['requests']} (retries : {s['retries']}, erreurs : {s['errors']}, "
+                f"attentes de débit : {s['throttle_waits']} / {s['throttle_time']:.1f}s, rejouées : {s['replayed']})")
+
+
+def add_archive_args(parser):
+    parser.add_argument("--record",type=str,help="Enregistre les réponses API dans cette archive")
+    parser.add_argument("--replay",type=str,help="Rejoue les réponses API depuis cette archive (hors ligne)")
+
+
+def open_archive_from_args(args):
+    if args.record:
+        client.open_archive(args.record,"record")
+    elif args.replay:
+        client.open_archive(args.replay,"replay")
+
+
+# Instance partagée par tous les scripts
+client=KaspaClient()
+if os.environ.get("KASPA_HTTP_ARCHIVE"):
+    client.open_archive(os.environ["KASPA_HTTP_ARCHIVE"],os.environ.get("KASPA_HTTP_MODE","replay"))
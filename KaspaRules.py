@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import re
+import string
+import time
+from itertools import chain
+
+import numpy as np
+
+# Règles de risque déclaratives : risk_rules.json (ou KASPA_RISK_RULES) contient une section par
+# jeu de caractéristiques ("relations" pour NewKaspAPI, "pyvis" pour PyvisAugustinV3). Chaque règle :
+#   {"name":..., "all"|"any":[[caractéristique, opérateur, seuil], ...], "weight":..., "message":...}
+# - seuil : un nombre ou le nom d'une autre caractéristique ;
+# - weight : un nombre ou le nom d'une caractéristique (sa valeur est ajoutée au score) ;
+# - message : format Python sur les caractéristiques, ex. "{total_in:.0f} KAS".
+# Les ratios sans dénominateur valent NaN : toute comparaison est alors fausse, sauf "!=".
+# compile_rules() valide le tout une fois ; RuleSet.evaluate() score toutes les adresses en un
+# seul passage vectorisé (chaque condition distincte n'est évaluée qu'une fois).
+
+RULES_FILE=os.environ.get("KASPA_RISK_RULES",os.path.join(os.path.dirname(os.path.abspath(__file__)),"risk_rules.json"))
+KAS_EUR=0.02809
+SOMPI=100000000
+
+OPERATORS={"<":np.less,"<=":np.less_equal,">":np.greater,">=":np.greater_equal,"==":np.equal,"!=":np.not_equal}
+
+RELATION_FEATURES={
+    "total_in":"Montant total reçu (KAS)",
+    "total_out":"Montant total envoyé (KAS)",
+    "total_in_eur":"Montant total reçu (€)",
+    "total_out_eur":"Montant total envoyé (€)",
+    "nb_transacs_in":"Nombre de transactions entrantes",
+    "nb_transacs_out":"Nombre de transactions sortantes",
+    "nb_sources":"Nombre d'adresses sources distinctes",
+    "nb_targets":"Nombre d'adresses cibles distinctes",
+    "cercle":"Cercle de l'adresse (0 = adresse initiale)",
+    "last_cercle":"1 si l'adresse est dans le dernier cercle exploré (sorties non suivies), 0 sinon",
+    "average_amount_in":"Montant moyen reçu par transaction (KAS)",
+    "dispersion_ratio":"Part des fonds reçus qui ressortent (total_out / total_in)",
+    "dispersion_pct":"dispersion_ratio en %",
+    "transac_ratio":"Transactions sortantes par transaction entrante",
+    "nb_round_amount":"Nombre de cibles ayant reçu un montant multiple de 10 KAS",
+}
+
+GRAPH_FEATURES={
+    "in_degree":"Nombre de prédécesseurs distincts",
+    "out_degree":"Nombre de successeurs distincts",
+    "total_connections":"in_degree + out_degree",
+    "tx_count_score":"Somme, sur les arêtes sortantes, de 2 (plus de 10 transactions) ou 1 (plus de 5)",
+    "layer":"Cercle du nœud",
+}
+
+SECTIONS={"relations":RELATION_FEATURES,"pyvis":GRAPH_FEATURES}
+
+
+def load_rules(path=None,section="relations"):
+    path=path or RULES_FILE
+    with open(path,encoding="utf-8") as f:
+        config=json.load(f)
+    if section not in config:
+        raise ValueError(f"Section '{section}' absente de {path}")
+    return compile_rules(config[section],SECTIONS[section])
+
+
+def compile_rules(config,known=RELATION_FEATURES):
+    return RuleSet(config,known)
+
+
+class RuleSet:
+    """Jeu de règles validé, prêt à scorer des colonnes de caractéristiques (tableaux NumPy).
+
+    evaluate() rend les scores et la matrice des règles déclenchées (une ligne par règle) ;
+    results() ajoute niveaux, couleurs et messages, au format de NewKaspAPI.risk_scores.
+    """
+
+    def __init__(self,config,known=RELATION_FEATURES):
+        self.known=known
+        self.max_score=config.get("max_score")
+        levels=sorted(config.get("levels") or [])
+        self.level_min=[level[0] for level in levels]
+        self.levels=[tuple(level[1:]) for level in levels]
+        self.conditions=[]
+        self.rules=[]
+        index={}
+        for k,rule in enumerate(config.get("rules") or []):
+            name=rule.get("name",f"règle {k}")
+            if ("all" in rule)==("any" in rule):
+                raise ValueError(f"{name} : une (et une seule) clé 'all' ou 'any' attendue")
+            ids=[]
+            for condition in rule.get("all",rule.get("any")):
+                feature,op,value=condition
+                self.check(name,feature)
+                if op not in OPERATORS:
+                    raise ValueError(f"{name} : opérateur inconnu '{op}' ({', '.join(OPERATORS)})")
+                if isinstance(value,str):
+                    self.check(name,value)
+                elif not isinstance(value,(int,float)):
+                    raise ValueError(f"{name} : seuil invalide {value!r}")
+                key=(feature,op,value)
+                if key not in index:
+                    index[key]=len(self.conditions)
+                    self.conditions.append(key)
+                ids.append(index[key])
+            weight=rule.get("weight",0)
+            if isinstance(weight,str):
+                self.check(name,weight)
+            message=rule.get("message")
+            fields=[]
+            if message:
+                for _,field,_,_ in string.Formatter().parse(message):
+                    if field is not None:
+                        fields.append(re.split(r"[.\[]",field)[0])
+                        self.check(name,fields[-1])
+            self.rules.append({"name":name,"conditions":ids,"any":"any" in rule,"weight":weight,
+                               "message":message,"fields":list(dict.fromkeys(fields))})
+        self.features=set(chain.from_iterable([c[0]]+([c[2]] if isinstance(c[2],str) else []) for c in self.conditions))
+        self.features.update(r["weight"] for r in self.rules if isinstance(r["weight"],str))
+        self.features.update(chain.from_iterable(r["fields"] for r in self.rules))
+
+    def floor(self,feature):
+        # Seuil t tel que la caractéristique n'a d'effet que si elle dépasse t : chaque règle qui s'en
+        # sert exige (en "all") feature > t ou >= t+1 (caractéristiques entières). None sinon.
+        floors=[]
+        for rule in self.rules:
+            conditions=[self.conditions[i] for i in rule["conditions"]]
+            if feature not in [rule["weight"]]+rule["fields"]+[c[2] for c in conditions]+[c[0] for c in conditions]:
+                continue
+            if feature in [c[2] for c in conditions] or feature==rule["weight"] or rule["any"]:
+                return None
+            bounds=[value if op==">" else value-1 for f,op,value in conditions if f==feature and op in (">",">=")]
+            if not bounds:
+                return None
+            floors.append(max(bounds))
+        return min(floors) if floors else None
+
+    def check(self,name,feature):
+        if feature not in self.known:
+            raise ValueError(f"{name} : caractéristique inconnue '{feature}' ({', '.join(self.known)})")
+
+    def evaluate(self,features):
+        n=len(next(iter(features.values()))) if features else 0
+        masks=[OPERATORS[op](features[feature],features[value] if isinstance(value,str) else value)
+               for feature,op,value in self.conditions]
+        fired=np.zeros((len(self.rules),n),dtype=bool)
+        score=np.zeros(n,dtype=np.int64)
+        for k,rule in enumerate(self.rules):
+            if rule["conditions"]:
+                reduce=np.logical_or if rule["any"] else np.logical_and
+                fired[k]=reduce.reduce([masks[i] for i in rule["conditions"]])
+            else:
+                fired[k]=True
+            weight=features[rule["weight"]] if isinstance(rule["weight"],str) else rule["weight"]
+            score=score+fired[k]*weight
+        if self.max_score is not None:
+            score=np.minimum(score,self.max_score)
+        return score,fired
+
+    def messages(self,features,fired):
+        # Messages des seules adresses concernées, dans l'ordre des règles
+        risks={}
+        for rule,mask in zip(self.rules,fired):
+            if not rule["message"]:
+                continue
+            flagged=np.flatnonzero(mask)
+            columns=[features[field][flagged].tolist() for field in rule["fields"]]
+            for i,values in zip(flagged.tolist(),zip(*columns) if columns else ((),)*len(flagged)):
+                risks.setdefault(i,[]).append(rule["message"].format(**dict(zip(rule["fields"],values))))
+        return risks
+
+    def results(self,keys,features):
+        score,fired=self.evaluate(features)
+        risks=self.messages(features,fired)
+        if not self.levels:
+            return {key:{"score":s,"risks":risks.get(i,[])} for i,(key,s) in enumerate(zip(keys,score.tolist()))}
+        level=np.maximum(np.searchsorted(self.level_min,score,side="right")-1,0).tolist()
+        return {key:{"score":s,"level":self.levels[l][0],"color":self.levels[l][1],"risks":risks.get(i,[])}
+                for i,(key,s,l) in enumerate(zip(keys,score.tolist(),level))}
+
+
+def ratio(a,b):
+    return np.divide(a,b,out=np.full(len(a),np.nan),where=b>0)
+
+
+def derive(features,nb_cercles):
+    # Caractéristiques calculées à partir des colonnes de base
+    features["total_in_eur"]=features["total_in"]*KAS_EUR
+    features["total_out_eur"]=features["total_out"]*KAS_EUR
+    features["last_cercle"]=(features["cercle"]==nb_cercles-1).astype(np.int64)
+    features["average_amount_in"]=ratio(features["total_in"],features["nb_transacs_in"])
+    features["dispersion_ratio"]=ratio(features["total_out"],features["total_in"])
+    features["dispersion_pct"]=features["dispersion_ratio"]*100
+    features["transac_ratio"]=ratio(features["nb_transacs_out"],features["nb_transacs_in"])
+    return features
+
+
+def is_round_amount(amounts):
+    # Montants en sompi (entiers) multiples de 10 KAS : définition commune à risk_scores et csr_features
+    return amounts%(10*SOMPI)==0
+
+
+def csr_features(arrays,nb_cercles):
+    # Caractéristiques "relations" (cf. NewKaspAPI.risk_scores) depuis un export KaspaCSR (adresses
+    # explorées seulement), sans repasser par Python
+    n=int((np.asarray(arrays["cercle"])>=0).sum())
+    degrees=np.diff(arrays["out_offsets"][:n+1])
+    owners=np.repeat(np.arange(n),degrees)
+    amounts=np.asarray(arrays["out_amount"][:arrays["out_offsets"][n]])
+    features={"total_in":arrays["amount_in"][:n]/SOMPI,"total_out":arrays["amount_out"][:n]/SOMPI,
+              "nb_transacs_in":np.asarray(arrays["nb_transacs_in"][:n]),"nb_transacs_out":np.asarray(arrays["nb_transacs_out"][:n]),
+              "nb_sources":np.diff(arrays["in_offsets"][:n+1]),"nb_targets":degrees,
+              "cercle":np.asarray(arrays["cercle"][:n],dtype=np.int64),
+              "nb_round_amount":np.bincount(owners[is_round_amount(amounts)],minlength=n)}
+    return derive(features,nb_cercles)
+
+
+def rescore(path,rules_path=None,nb_cercles=None,top=20):
+    # Re-score d'un graphe exporté (--exportCsr de NewKaspAPI) avec les règles du moment
+    from KaspaCSR import load_csr
+    arrays,meta=load_csr(path)
+    nb_cercles=nb_cercles or meta.get("nb_cercles")
+    start=time.perf_counter()
+    rules=load_rules(rules_path)
+    features=csr_features(arrays,nb_cercles)
+    keys=[a.decode() for a in arrays["address"][:len(features["cercle"])]]
+    results=rules.results(keys,features)
+    elapsed=time.perf_counter()-start
+    print(f"{len(results)} adresses scorées avec {len(rules.rules)} règles en {elapsed*1000:.1f} ms")
+    for addr,risk in sorted(results.items(),key=lambda item:-item[1]["score"])[:top]:
+        print(f"{risk['score']:>4} {risk.get('level',''):<9} {addr}")
+        for message in risk["risks"]:
+            print(f"       - {message}")
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Re-score d'un graphe exporté (CSR) avec des règles de risque déclaratives")
+    parser.add_argument("csr",nargs="?",help="Dossier exporté par NewKaspAPI --exportCsr")
+    parser.add_argument("--rules",type=str,help=f"Fichier de règles (défaut : {RULES_FILE})")
+    parser.add_argument("--nbCercles",type=int,help="Nombre de cercles (défaut : celui de l'export)")
+    parser.add_argument("--top",type=int,default=20,help="Nombre d'adresses affichées")
+    parser.add_argument("--features",action="store_true",help="Liste les caractéristiques utilisables dans les règles")
+    args=parser.parse_args()
+    if args.features:
+        for section,known in SECTIONS.items():
+            print(f"[{section}]")
+            for name,description in known.items():
+                print(f"  {name:<18} {description}")
+    elif args.csr:
+        rescore(args.csr,args.rules,args.nbCercles,args.top)
+    else:
+        parser.error("dossier CSR manquant (ou --features)")
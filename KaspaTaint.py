@@ -0,0 +1,192 @@
+import argparse
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+# Propagation de la "teinte" (taint) des fonds de l'adresse initiale dans le graphe exploré :
+# pour chaque adresse, la part de ce qu'elle a reçu qui provient plausiblement de l'adresse initiale.
+#
+# - poison : toute adresse qui reçoit quoi que ce soit d'une adresse teintée l'est entièrement ;
+# - haircut : la part teintée reçue est proportionnelle à la teinte de l'émetteur
+#   (teinte(v) = somme des montants u->v * teinte(u) / total reçu par v), sur toutes les arêtes,
+#   boucles comprises, jusqu'au point fixe ;
+# - fifo : sur les transactions dans l'ordre chronologique, chaque adresse dépense d'abord ce
+#   qu'elle a reçu en premier (file de segments montant/teinte par adresse).
+#
+# poison et haircut travaillent sur le graphe agrégé (relations ou export KaspaCSR) par
+# itérations matrice creuse - vecteur : np.bincount(cibles, montants * teinte[sources]).
+# Limites : le graphe agrégé ignore l'ordre des transactions (fifo en tient compte) et ne connaît
+# des adresses non explorées que leurs échanges avec le graphe.
+
+POLICIES=("poison","haircut","fifo")
+SOMPI=100000000
+EPS=1e-12
+# haircut : arrêt quand la teinte ne bouge plus de plus de TOLERANCE, ou après MAX_ITERATIONS
+TOLERANCE=1e-9
+MAX_ITERATIONS=1000
+
+
+def graph_edges(arrays):
+    # Arêtes (source, cible, montant en KAS) d'un graphe KaspaCSR : sorties des adresses explorées,
+    # plus entrées venant d'adresses non explorées (les autres sont déjà vues côté émetteur).
+    # Côté entrées, le montant est celui des entrées de la source (cf. explore_address).
+    explored=np.asarray(arrays["cercle"])>=0
+    n=len(explored)
+    def side(name):
+        offsets=np.asarray(arrays[f"{name}_offsets"])
+        owners=np.repeat(np.arange(n),np.diff(offsets))
+        return owners,np.asarray(arrays[f"{name}_neighbors"],dtype=np.int64),np.asarray(arrays[f"{name}_amount"])/SOMPI
+    src,dst,amount=side("out")
+    in_dst,in_src,in_amount=side("in")
+    keep=~explored[in_src]
+    return n,np.concatenate([src,in_src[keep]]),np.concatenate([dst,in_dst[keep]]),np.concatenate([amount,in_amount[keep]])
+
+
+def distances(n,src,dst,seed):
+    # Nombre minimal de sauts depuis l'adresse initiale (-1 : non atteinte), par parcours en largeur
+    dist=np.full(n,-1,dtype=np.int64)
+    dist[seed]=0
+    frontier=np.zeros(n,dtype=bool)
+    frontier[seed]=True
+    level=0
+    while True:
+        reached=np.bincount(dst,weights=frontier[src],minlength=n)>0
+        frontier=reached&(dist<0)
+        if not frontier.any():
+            return dist,level
+        level+=1
+        dist[frontier]=level
+
+
+def propagate(n,src,dst,amount,seed,policy="haircut",tol=TOLERANCE,max_iterations=MAX_ITERATIONS):
+    # Rend (teinte, montant teinté reçu, itérations)
+    if policy not in ("poison","haircut"):
+        raise ValueError(f"Politique inconnue pour le graphe agrégé : {policy} (poison, haircut)")
+    received=np.bincount(dst,weights=amount,minlength=n)
+    if policy=="poison":
+        dist,depth=distances(n,src,dst,seed)
+        taint=(dist>=0).astype(np.float64)
+        return taint,taint*received,depth
+    # Itération sur toutes les arêtes : les fonds qui reviennent par une boucle (blanchiment en
+    # cercle) ramènent leur teinte. Partie de 0 hors adresse initiale, la teinte ne fait que
+    # croître vers le plus petit point fixe : aucune teinte ne s'auto-entretient dans un cycle.
+    taint=np.zeros(n)
+    taint[seed]=1.0
+    iterations=0
+    while iterations<max_iterations:
+        iterations+=1
+        flow=np.bincount(dst,weights=amount*taint[src],minlength=n)
+        new=np.minimum(np.divide(flow,received,out=np.zeros(n),where=received>0),1.0)
+        new[seed]=1.0
+        delta=np.abs(new-taint).max()
+        taint=new
+        if delta<tol:
+            break
+    return taint,taint*received,iterations
+
+
+def taint_csr(arrays,seed,policy="haircut"):
+    # seed : indice (ou adresse) de l'adresse initiale dans l'export
+    if not isinstance(seed,(int,np.integer)):
+        seed=int(np.flatnonzero(np.asarray(arrays["address"])==seed.encode())[0])
+    return propagate(*graph_edges(arrays),seed,policy)
+
+
+def taint_relations(relations,seed,policy="haircut"):
+    # relations de NewKaspAPI (clés : identifiants ou adresses) -> {clé: {"taint":..., "amount":...}}
+    from KaspaCSR import relations_to_csr
+    arrays=relations_to_csr(relations,str)
+    keys=arrays["address_id"].tolist() if "address_id" in arrays else [a.decode() for a in arrays["address"]]
+    if seed not in keys:
+        return {}
+    taint,amount,_=propagate(*graph_edges(arrays),keys.index(seed),policy)
+    return {key:{"taint":t,"amount":a} for key,t,a in zip(keys,taint.tolist(),amount.tolist())}
+
+
+def consume(queue,amount):
+    # Retire `amount` en tête de file ; ce qui manque (historique antérieur à la fenêtre) est non teinté
+    segments=[]
+    while amount>EPS and queue:
+        head=queue[0]
+        take=min(amount,head[0])
+        segments.append([take,head[1]])
+        head[0]-=take
+        amount-=take
+        if head[0]<=EPS:
+            queue.popleft()
+    if amount>EPS:
+        segments.append([amount,0.0])
+    return segments
+
+
+def taint_fifo(transacs,seed):
+    # transacs : (inputs, outputs) au format de get_inputs_ouputs / build_inout (listes de
+    # {"address","amount"}, sorties de rendu retirées), dans l'ordre chronologique
+    queues={}
+    received={}
+    tainted={}
+    for inputs,outputs in transacs:
+        total_in=sum(i["amount"] for i in inputs)
+        total_out=sum(o["amount"] for o in outputs)
+        if total_in<=0 or total_out<=0:
+            continue
+        # Seul ce qui sort réellement (hors rendu et frais) est dépensé, au prorata des entrées
+        scale=min(1.0,total_out/total_in)
+        segments=[]
+        for input in inputs:
+            if input["address"]==seed:
+                segments.append([input["amount"]*scale,1.0])
+            else:
+                segments.extend(consume(queues.setdefault(input["address"],deque()),input["amount"]*scale))
+        # Les sorties prennent les segments dans l'ordre des entrées (FIFO dans la transaction aussi)
+        k=0
+        for output in outputs:
+            addr=output["address"]
+            queue=queues.setdefault(addr,deque())
+            need=output["amount"]
+            while need>EPS:
+                if k<len(segments):
+                    take=min(need,segments[k][0])
+                    fraction=segments[k][1]
+                    segments[k][0]-=take
+                    if segments[k][0]<=EPS:
+                        k+=1
+                else:
+                    take,fraction=need,0.0
+                if queue and queue[-1][1]==fraction:
+                    queue[-1][0]+=take
+                else:
+                    queue.append([take,fraction])
+                received[addr]=received.get(addr,0.0)+take
+                tainted[addr]=tainted.get(addr,0.0)+take*fraction
+                need-=take
+    result={addr:{"taint":tainted[addr]/total if total>0 else 0.0,"amount":tainted[addr]} for addr,total in received.items()}
+    result[seed]={"taint":1.0,"amount":received.get(seed,0.0)}
+    return result
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Propagation de la teinte de l'adresse initiale sur un graphe exporté (CSR)")
+    parser.add_argument("csr",help="Dossier exporté par NewKaspAPI --exportCsr")
+    parser.add_argument("--policy",choices=["poison","haircut"],default="haircut",
+                        help="Politique de propagation (fifo : NewKaspAPI --taint fifo)")
+    parser.add_argument("--seed",type=str,help="Adresse initiale (défaut : celle de l'export)")
+    parser.add_argument("--top",type=int,default=20,help="Nombre d'adresses affichées")
+    parser.add_argument("--output",type=str,help="Écrit la teinte de chaque adresse dans ce fichier JSON")
+    args=parser.parse_args()
+
+    from KaspaCSR import load_csr
+    arrays,meta=load_csr(args.csr)
+    start=time.perf_counter()
+    taint,amount,iterations=taint_csr(arrays,args.seed or meta["initial_address"],args.policy)
+    elapsed=time.perf_counter()-start
+    addresses=[a.decode() for a in arrays["address"]]
+    print(f"{args.policy} : {int((taint>0).sum())}/{len(taint)} adresses teintées, {iterations} itérations, "
+          f"{meta['nb_edges_out']} arêtes, {elapsed*1000:.1f} ms")
+    for i in np.argsort(-amount,kind="stable")[:args.top].tolist():
+        print(f"{taint[i]*100:>7.2f} % {amount[i]:>16.2f} KAS  {addresses[i]}")
+    if args.output:
+        with open(args.output,"w") as f:
+            json.dump({addr:{"taint":t,"amount":a} for addr,t,a in zip(addresses,taint.tolist(),amount.tolist())},f)
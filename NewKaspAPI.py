@@ -1,79 +1,348 @@
-import requests
-from pyvis.network import Network
+from KaspaClient import client,add_archive_args,open_archive_from_args,RETRY_STATUS
+from KaspaCache import CacheDB,AddressIndex
 import time
 import os
 import json
+import argparse
+import heapq
+import socket
 import sqlite3
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from itertools import chain
+from operator import itemgetter
 
-URLADDRESS="https://api.kaspa.org/addresses/"
-URLTRANSAC="https://api.kaspa.org/transactions/"
-CACHE_FILE="transacs_cache.db"
-conn=sqlite3.connect(CACHE_FILE)
-cursor=conn.cursor()
+# KASPA_API_URL permet de pointer vers un serveur local (tests, bouchon d'API)
+URLAPI=os.environ.get("KASPA_API_URL","https://api.kaspa.org").rstrip("/")
+URLADDRESS=URLAPI+"/addresses/"
+URLTRANSAC=URLAPI+"/transactions/"
+# KASPA_CACHE_DB permet à plusieurs workers de partager le même cache / la même file de travail
+CACHE_FILE=os.environ.get("KASPA_CACHE_DB","transacs_cache.db")
+PAGE_SIZE=100
+SEARCH_BATCH=500
+NAMES_LRU_SIZE=100000
+LEASE_TIME=600
+MAX_ATTEMPTS=3
+LOCK_RETRIES=5
+# Durées de vie du cache (en jours, 0 = pas d'expiration) et taille max en Mo (0 = illimitée)
+NAMES_TTL_DAYS=float(os.environ.get("KASPA_NAMES_TTL_DAYS",7))
+CHECKPOINTS_TTL_DAYS=float(os.environ.get("KASPA_CHECKPOINTS_TTL_DAYS",30))
+CACHE_MAX_MB=float(os.environ.get("KASPA_CACHE_MAX_MB",0))
+EVICT_BATCH=100
+# Ouverte (et schéma créé) à la première requête : importer le module n'écrit rien sur disque
+db=CacheDB(CACHE_FILE)
+# Les adresses circulent sous forme d'identifiants entiers (table addresses) ; la chaîne n'est
+# retrouvée que pour l'API, la table names et l'affichage
+address_index=AddressIndex(db)
 
 def init_db():
-    cursor.execute('''
+    db.execute('''
         CREATE TABLE IF NOT EXISTS names (
                 address TEXT PRIMARY KEY,
-                data TEXT
+                data TEXT,
+                fetched_at REAL
         )
     ''')
+    add_column("names","fetched_at","REAL")
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            transac_hash TEXT PRIMARY KEY,
-            data TEXT
+    # Adresses internées : identifiant entier dense utilisé par le cache et le parcours
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INTEGER PRIMARY KEY,
+            address TEXT UNIQUE
         )
     ''')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions_inout (
-            transac_hash TEXT PRIMARY KEY,
-            inputs TEXT,
-            outputs TEXT
+    # Schéma normalisé : une ligne par transaction / entrée / sortie, montants entiers en sompi
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS tx (
+            hash TEXT PRIMARY KEY,
+            block_time INTEGER
         )
     ''')
-    conn.commit()
 
-init_db()
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS tx_input (
+            tx_hash TEXT,
+            idx INTEGER,
+            address_id INTEGER,
+            amount INTEGER,
+            prev_hash TEXT,
+            prev_idx INTEGER,
+            PRIMARY KEY (tx_hash,idx)
+        )
+    ''')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS tx_output (
+            tx_hash TEXT,
+            idx INTEGER,
+            address_id INTEGER,
+            amount INTEGER,
+            PRIMARY KEY (tx_hash,idx)
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_tx_block_time ON tx (block_time)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_tx_input_address ON tx_input (address_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_tx_output_address ON tx_output (address_id)')
+
+    # Transactions connues de chaque adresse + point de synchro (re-crawl incrémental)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS address_transacs (
+            address TEXT,
+            transac_hash TEXT,
+            block_time INTEGER,
+            PRIMARY KEY (address,transac_hash)
+        )
+    ''')
+    # Historique d'une adresse du plus récent au plus ancien (iter_address_inout, par lots)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_address_transacs_time ON address_transacs (address,block_time DESC,transac_hash)')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS address_sync (
+            address TEXT PRIMARY KEY,
+            last_hash TEXT,
+            last_block_time INTEGER,
+            depth INTEGER,
+            complete INTEGER,
+            synced_at REAL
+        )
+    ''')
+
+    # Points de reprise d'un parcours (--resume), écrits après chaque adresse explorée
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_runs (
+            run_id TEXT PRIMARY KEY,
+            cercle INTEGER,
+            addr_list TEXT,
+            done INTEGER,
+            updated_at REAL
+        )
+    ''')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_relations (
+            run_id TEXT,
+            address TEXT,
+            pos INTEGER,
+            data TEXT,
+            PRIMARY KEY (run_id,address)
+        )
+    ''')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_seen (
+            run_id TEXT,
+            address TEXT,
+            PRIMARY KEY (run_id,address)
+        )
+    ''')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_futur (
+            run_id TEXT,
+            seq INTEGER,
+            address TEXT,
+            PRIMARY KEY (run_id,seq)
+        )
+    ''')
+
+    # File de travail partagée entre workers (--strategy distributed / --worker)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS work_runs (
+            run_id TEXT PRIMARY KEY,
+            lim INTEGER,
+            status TEXT
+        )
+    ''')
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS work_queue (
+            run_id TEXT,
+            address TEXT,
+            cercle INTEGER,
+            seq INTEGER,
+            status TEXT,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER DEFAULT 0,
+            result TEXT,
+            PRIMARY KEY (run_id,address)
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_work_queue_status ON work_queue (status,seq)')
+    migrate_transactions_cache()
+    db.flush()
+
+def add_column(table,column,decl):
+    # Colonne ajoutée après coup : les caches existants sont mis à niveau à l'ouverture
+    if column not in [row[1] for row in db.execute(f'PRAGMA table_info({table})').fetchall()]:
+        db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+def is_expired(timestamp,ttl_days):
+    # Pas d'horodatage (cache antérieur aux TTL) = à rafraîchir
+    return ttl_days>0 and (timestamp is None or timestamp<time.time()-ttl_days*86400)
+
+def migrate_transactions_cache():
+    # Ancien cache : transactions brutes (JSON) dans transactions, résumés dans transactions_inout.
+    # Migration unique : les transactions brutes sont versées dans tx/tx_input/tx_output, seule
+    # copie tenue à jour désormais, puis les deux anciennes tables sont supprimées.
+    tables={row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if not tables&{"transactions","transactions_inout"}:
+        return
+    nb=0
+    if "transactions" in tables:
+        for (data,) in db.query('SELECT data FROM transactions'):
+            save_tx_db(json.loads(data))
+            nb+=1
+    db.execute('DROP TABLE IF EXISTS transactions')
+    db.execute('DROP TABLE IF EXISTS transactions_inout')
+    print(f"Cache migré vers le schéma normalisé : {nb} transactions (--vacuum pour récupérer la place)")
+
+def get_transac_hash(transac):
+    return transac.get("verboseData",{}).get("transactionId") or transac.get("hash")
+
+def intern_address(address):
+    return address_index.id(address) if address else None
+
+def output_rows(transac):
+    transac_hash=get_transac_hash(transac)
+    return [(transac_hash,int(output.get("index",k)),intern_address(output.get("script_public_key_address")),int(output.get("amount",0)))
+            for k,output in enumerate(transac.get("outputs") or [])]
+
+def save_tx_db(transac):
+    transac_hash=get_transac_hash(transac)
+    input_rows=[(transac_hash,k,intern_address(input.get("previous_outpoint_address")),int(input.get("previous_outpoint_amount") or 0),
+                 input.get("previous_outpoint_hash"),int(input.get("previous_outpoint_index") or 0))
+                for k,input in enumerate(transac.get("inputs") or [])]
+    outputs=output_rows(transac)
+    db.write('INSERT OR IGNORE INTO tx (hash,block_time) VALUES (?,?)',(transac_hash,transac.get("block_time") or 0))
+    db.write_many('INSERT OR IGNORE INTO tx_input (tx_hash,idx,address_id,amount,prev_hash,prev_idx) VALUES (?,?,?,?,?,?)',input_rows)
+    # Dernière écriture de la transaction : ses lignes restent lisibles par db.queued(hash) tant
+    # qu'elles sont en file (get_inout_db, tx_exists, get_outpoints_db n'attendent pas l'écrivain)
+    db.write_many('INSERT OR IGNORE INTO tx_output (tx_hash,idx,address_id,amount) VALUES (?,?,?,?)',outputs,
+                  overlay={transac_hash:(input_rows,outputs)})
+
+def iter_address_data(address,limit,page_size=PAGE_SIZE,offset=0):
+    # Parcourt l'historique page par page (offset/limit) et rend les transactions une à une :
+    # la mémoire reste bornée à une page. limit = nombre max de transactions (None/0 = tout).
+    end=offset+limit if limit else None
+    while end is None or offset<end:
+        size=min(page_size,end-offset) if end else page_size
+        db.release()
+        page=client.get(URLADDRESS+address+f"/full-transactions?limit={size}&offset={offset}&resolve_previous_outpoints=light").json()
+        if not isinstance(page,list) or not page:
+            return
+        yield from page
+        if len(page)<size:
+            return
+        offset+=len(page)
 
 def get_address_data(address,limit):
-    return requests.get(URLADDRESS+address+f"/full-transactions?limit={limit}&offset=0&resolve_previous_outpoints=light").json()
+    return list(iter_address_data(address,limit))
 
-def verify_name(address):
-    cursor.execute('SELECT data FROM names WHERE address = ?',(address,))
-    row=cursor.fetchone()
-    if row:
-        return json.loads(row[0])
-    
+def fetch_name(address):
+    # Appel réseau seul (pas de lecture SQLite) : utilisable depuis un thread.
+    # None si l'API n'a pas pu répondre (rien ne doit alors être mis en cache) ; une réponse
+    # absente de l'archive (--replay) remonte à l'appelant au lieu de passer pour "sans nom"
+    import requests
+    db.release()
     try:
-        res=requests.get(f"{URLADDRESS}{address}/name")
-        name_data=res.json()
-    except:
-        name_data={}
+        res=client.get(f"{URLADDRESS}{address}/name")
+        if res.status_code in RETRY_STATUS:
+            print(f"ERREUR : nom de {address} non résolu - HTTP {res.status_code}")
+            return None
+        return res.json()
+    except (requests.exceptions.RequestException,ValueError) as e:
+        print(f"ERREUR : nom de {address} non résolu - {e}")
+        return None
+
+class LRUCache:
+    def __init__(self,maxsize):
+        self.maxsize=maxsize
+        self.data=OrderedDict()
+
+    def get(self,key):
+        if key not in self.data:
+            return None
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def put(self,key,value):
+        self.data[key]=value
+        self.data.move_to_end(key)
+        if len(self.data)>self.maxsize:
+            self.data.popitem(last=False)
+
+# Niveau mémoire devant la table names : évite un SELECT par entrée/sortie
+names_cache=LRUCache(NAMES_LRU_SIZE)
+
+def get_name_db(address):
+    name_data=names_cache.get(address)
+    if name_data is not None:
+        return name_data
+    row=db.execute('SELECT data,fetched_at FROM names WHERE address = ?',(address,)).fetchone()
+    if row and not is_expired(row[1],NAMES_TTL_DAYS):
+        name_data=json.loads(row[0])
+        names_cache.put(address,name_data)
+        return name_data
+    return None
+
+def save_names(names):
+    # names : liste de (adresse, données) ; le commit est fait par l'appelant
+    now=time.time()
+    db.write_many('INSERT OR REPLACE INTO names (address,data,fetched_at) VALUES (?,?,?)',[(a,json.dumps(d),now) for a,d in names])
+    for address,name_data in names:
+        names_cache.put(address,name_data)
+
+def verify_name(address):
+    name_data=get_name_db(address)
+    if name_data is not None:
+        return name_data
     
-    cursor.execute('INSERT OR REPLACE INTO names (address,data) VALUES (?,?)',(address,json.dumps(name_data)))
-    conn.commit()
+    name_data=fetch_name(address)
+    if name_data is None:
+        return {}
+    save_names([(address,name_data)])
     return name_data
 
-def save_transac_db(transac_hash,transac_data):
-    cursor.execute('INSERT OR IGNORE INTO transactions (transac_hash,data) VALUES (?,?)',(transac_hash,json.dumps(transac_data)))
+async def fetch_names_async(addresses,fetch):
+    # Résout en un lot concurrent les noms absents du cache, puis un seul commit
+    import asyncio
+    missing=[a for a in dict.fromkeys(addresses) if get_name_db(a) is None]
+    db.release()
+    results=await asyncio.gather(*(fetch(fetch_name,a) for a in missing))
+    save_names([(a,name_data) for a,name_data in zip(missing,results) if name_data is not None])
+    db.commit()
 
-def get_transac_db(transac_hash):
-    cursor.execute('SELECT data FROM transactions WHERE transac_hash = ?',(transac_hash,))
-    row=cursor.fetchone()
-    if row: return json.loads(row[0])
-    return None
+def tx_exists(transac_hash):
+    # Sans attendre le thread d'écriture : une transaction encore en file est dans db.queued()
+    queued=db.queued(transac_hash)
+    if queued and queued[0] is not None:
+        return True
+    return db.execute('SELECT 1 FROM tx WHERE hash = ?',(transac_hash,),wait=False).fetchone() is not None
+
+def build_inout(input_rows,output_rows):
+    # Même résumé que get_inputs_ouputs, à partir des lignes (identifiant d'adresse, montant en sompi) :
+    # les adresses du résumé sont des identifiants d'address_index
+    inputs=[{"address":addr,"amount":amount/100000000} for addr,amount in input_rows if addr]
+    input_addrs={i["address"] for i in inputs}
+    outputs=[{"address":addr,"amount":amount/100000000} for addr,amount in output_rows if addr and addr not in input_addrs]
+    return inputs,outputs
 
 def get_inout_db(transac_hash):
-    cursor.execute('SELECT inputs,outputs FROM transactions_inout WHERE transac_hash = ?',(transac_hash,))
-    row=cursor.fetchone()
-    if row: return json.loads(row[0]),json.loads(row[1])
-    return None, None
+    queued=db.queued(transac_hash)
+    if queued and queued[0] is not None:
+        inputs,outputs=queued
+        return build_inout([row[2:4] for row in inputs],[row[2:4] for row in sorted(outputs,key=lambda row:row[1])])
+    if not tx_exists(transac_hash):
+        return None, None
+    input_rows=db.execute('SELECT address_id,amount FROM tx_input WHERE tx_hash = ? ORDER BY idx',(transac_hash,),wait=False).fetchall()
+    output_rows=db.execute('SELECT address_id,amount FROM tx_output WHERE tx_hash = ? ORDER BY idx',(transac_hash,),wait=False).fetchall()
+    return build_inout(input_rows,output_rows)
 
-def save_transaction_inout(transac_hash,inputs,outputs):
-    cursor.execute('INSERT OR IGNORE INTO transactions_inout (transac_hash,inputs,outputs) VALUES (?,?,?)',(transac_hash,json.dumps(inputs),json.dumps(outputs)))
-        
 def get_inputs_ouputs(transac):
     inputs=[]
     outputs=[]
@@ -98,9 +367,197 @@ def get_inputs_ouputs(transac):
     
     return inputs,outputs
 
-def explore_address(relations,address,cercle,addrSeen,addrList,futurList,limit):
-    data_address=get_address_data(address,limit)
-    # print("Nb de transactions: ",len(data_address))
+def transac_outpoints(transac):
+    # (hash, index) -> (adresse, montant) des sorties d'une transaction au format de l'API
+    transac_hash=get_transac_hash(transac)
+    return {(transac_hash,int(output.get("index",k))):(output.get("script_public_key_address"),int(output.get("amount",0)))
+            for k,output in enumerate(transac.get("outputs") or [])}
+
+def save_outputs(transacs):
+    # Transactions précédentes récupérées par resolve_outpoints : seules leurs sorties sont gardées,
+    # dans tx_output (sans ligne tx, elles ne passent donc pas pour des transactions résumées)
+    rows={get_transac_hash(transac):output_rows(transac) for transac in transacs}
+    db.write_many('INSERT OR IGNORE INTO tx_output (tx_hash,idx,address_id,amount) VALUES (?,?,?,?)',
+                  [row for outputs in rows.values() for row in outputs],overlay={h:(None,outputs) for h,outputs in rows.items()})
+
+def get_outpoints_db(hashes):
+    # Sorties déjà en cache (tx_output), y compris celles encore dans la file d'écriture
+    outpoints={}
+    rows=[]
+    for transac_hash in hashes:
+        queued=db.queued(transac_hash)
+        if queued:
+            rows.extend(queued[1])
+    for transac_hash,idx,address_id,amount in rows:
+        outpoints[(transac_hash,idx)]=(address_index.address(address_id) if address_id else None,amount)
+    found={h for h,_ in outpoints}
+    hashes=[h for h in hashes if h not in found]
+    for i in range(0,len(hashes),SEARCH_BATCH):
+        batch=hashes[i:i+SEARCH_BATCH]
+        rows=db.execute(f'SELECT tx_hash,idx,address_id,amount FROM tx_output WHERE tx_hash IN ({",".join("?"*len(batch))})',batch,wait=False).fetchall()
+        for transac_hash,idx,address_id,amount in rows:
+            outpoints[(transac_hash,idx)]=(address_index.address(address_id) if address_id else None,amount)
+    return outpoints
+
+def fetch_transacs(hashes):
+    # Recherche groupée : une requête pour SEARCH_BATCH transactions au lieu d'une par entrée
+    transacs=[]
+    for i in range(0,len(hashes),SEARCH_BATCH):
+        db.release()
+        res=client.post(URLTRANSAC+"search?resolve_previous_outpoints=no",json={"transactionIds":hashes[i:i+SEARCH_BATCH]}).json()
+        if isinstance(res,list):
+            transacs.extend(res)
+    return transacs
+
+def resolve_outpoints(transacs):
+    # Complète en place les entrées d'une page de transactions dont l'adresse d'origine manque
+    missing=[]
+    for transac in transacs:
+        if tx_exists(get_transac_hash(transac)):
+            continue
+        for input in transac.get("inputs") or []:
+            if not input.get("previous_outpoint_address") and input.get("previous_outpoint_hash"):
+                missing.append(input)
+    if not missing:
+        return
+    hashes=list(dict.fromkeys(input["previous_outpoint_hash"] for input in missing))
+    # Sorties des transactions de la page elle-même (pas encore écrites), puis du cache, puis de l'API
+    needed=set(hashes)
+    outpoints={}
+    for transac in transacs:
+        if get_transac_hash(transac) in needed:
+            outpoints.update(transac_outpoints(transac))
+    found={h for h,_ in outpoints}
+    outpoints.update(get_outpoints_db([h for h in hashes if h not in found]))
+    found={h for h,_ in outpoints}
+    to_fetch=[h for h in hashes if h not in found]
+    if to_fetch:
+        fetched=fetch_transacs(to_fetch)
+        save_outputs(fetched)
+        for transac in fetched:
+            outpoints.update(transac_outpoints(transac))
+    for input in missing:
+        resolved=outpoints.get((input["previous_outpoint_hash"],int(input.get("previous_outpoint_index") or 0)))
+        if resolved:
+            input["previous_outpoint_address"],input["previous_outpoint_amount"]=resolved
+
+def decode_transac(transac):
+    transac_hash=get_transac_hash(transac)
+    inputs,outputs=get_inout_db(transac_hash)
+    if inputs is None or outputs is None:
+        save_tx_db(transac)
+        inputs,outputs=get_inout_db(transac_hash)
+    return inputs,outputs
+
+db.setup=init_db
+
+def get_sync_db(address):
+    row=db.execute('SELECT last_hash,last_block_time,depth,complete FROM address_sync WHERE address = ?',(address,)).fetchone()
+    if row: return {"last_hash":row[0],"last_block_time":row[1],"depth":row[2],"complete":row[3]}
+    return {"last_hash":None,"last_block_time":None,"depth":0,"complete":0}
+
+def save_sync_db(address,sync):
+    db.write('INSERT OR REPLACE INTO address_sync (address,last_hash,last_block_time,depth,complete,synced_at) VALUES (?,?,?,?,?,?)',
+               (address,sync["last_hash"],sync["last_block_time"],sync["depth"],sync["complete"],time.time()))
+
+def get_known_hashes(address):
+    return {row[0] for row in db.execute('SELECT transac_hash FROM address_transacs WHERE address = ?',(address,)).fetchall()}
+
+def save_address_transac(address,transac):
+    db.write('INSERT OR IGNORE INTO address_transacs (address,transac_hash,block_time) VALUES (?,?,?)',
+               (address,get_transac_hash(transac),transac.get("block_time") or 0))
+    decode_transac(transac)
+
+def fetch_address_delta(address,limit,sync,known):
+    # Appels HTTP seuls (utilisable depuis un thread) : rend les transactions de l'adresse absentes
+    # du cache et met à jour `sync`. Le cache contient toujours les `depth` transactions les plus
+    # récentes sans trou : on lit les pages récentes jusqu'à retomber sur une transaction connue,
+    # puis on ne complète l'historique plus ancien que si la limite le demande.
+    nb_new=0
+    hit=False
+    for transac in iter_address_data(address,limit):
+        transac_hash=get_transac_hash(transac)
+        if transac_hash in known:
+            hit=True
+            break
+        if nb_new==0:
+            sync["last_hash"]=transac_hash
+            sync["last_block_time"]=transac.get("block_time")
+        nb_new+=1
+        known.add(transac_hash)
+        yield transac
+    if hit:
+        depth=sync["depth"]+nb_new
+    else:
+        depth=nb_new
+        sync["complete"]=int(not limit or nb_new<limit)
+    if not sync["complete"] and (not limit or depth<limit):
+        nb_old=0
+        for transac in iter_address_data(address,limit-depth if limit else 0,offset=depth):
+            nb_old+=1
+            transac_hash=get_transac_hash(transac)
+            if transac_hash not in known:
+                known.add(transac_hash)
+                yield transac
+        depth+=nb_old
+        sync["complete"]=int(not limit or depth<limit)
+    sync["depth"]=depth
+
+def save_address_page(address,transacs):
+    resolve_outpoints(transacs)
+    for transac in transacs:
+        save_address_transac(address,transac)
+
+def sync_address(address,limit):
+    sync=get_sync_db(address)
+    page=[]
+    for transac in fetch_address_delta(address,limit,sync,get_known_hashes(address)):
+        page.append(transac)
+        if len(page)>=PAGE_SIZE:
+            save_address_page(address,page)
+            page=[]
+    save_address_page(address,page)
+    save_sync_db(address,sync)
+
+def iter_address_inout(address,limit):
+    # Voisinage d'une adresse déjà synchronisée, servi par SQL par lots de PAGE_SIZE transactions
+    # (pagination par clé sur (block_time, transac_hash)) : la mémoire reste bornée même avec
+    # limit=0. Chaque lot est lu d'un bloc : une lecture encore ouverte pendant les écritures de
+    # verify_name garderait un instantané périmé dès qu'un autre processus valide, et l'écriture
+    # échouerait (database is locked)
+    key=None
+    remaining=limit or None
+    while remaining is None or remaining>0:
+        size=min(PAGE_SIZE,remaining) if remaining else PAGE_SIZE
+        if key is None:
+            txs=db.execute('SELECT transac_hash,block_time FROM address_transacs WHERE address = ? ORDER BY block_time DESC,transac_hash LIMIT ?',
+                           (address,size)).fetchall()
+        else:
+            txs=db.execute('''SELECT transac_hash,block_time FROM address_transacs WHERE address = ?
+                              AND (block_time < ? OR (block_time = ? AND transac_hash > ?))
+                              ORDER BY block_time DESC,transac_hash LIMIT ?''',(address,key[1],key[1],key[0],size)).fetchall()
+        if not txs:
+            return
+        hashes=[transac_hash for transac_hash,_ in txs]
+        marks=",".join("?"*len(hashes))
+        rows={}
+        for side,table in enumerate(("tx_input","tx_output")):
+            for transac_hash,addr,amount in db.execute(f'SELECT tx_hash,address_id,amount FROM {table} WHERE tx_hash IN ({marks}) ORDER BY tx_hash,idx',hashes).fetchall():
+                rows.setdefault(transac_hash,([],[]))[side].append((addr,amount))
+        for transac_hash in hashes:
+            if transac_hash in rows:
+                yield build_inout(*rows[transac_hash])
+        if len(txs)<size:
+            return
+        key=txs[-1]
+        if remaining:
+            remaining-=len(txs)
+
+def explore_address(relations,address,cercle,addrSeen,addrList,futurList,limit,synced=False):
+    # address, relations, addrSeen, addrList, futurList : identifiants d'address_index
+    address_str=address_index.address(address)
+    if not synced:
+        sync_address(address_str,limit)
 
     if address not in relations:
         relations[address]={
@@ -113,29 +570,12 @@ def explore_address(relations,address,cercle,addrSeen,addrList,futurList,limit):
             "cercle":cercle
         }
 
-    for i,transac in enumerate(data_address):
-        # print(f"Transaction : {i+1}/{len(data_address)}")
-        transac_hash=transac.get("verboseData",{}).get("transactionId") or transac.get("hash")
-        inputs,outputs=get_inout_db(transac_hash)
-        if inputs is None or outputs is None:
-            cached_transac=get_transac_db(transac_hash)
-
-            if cached_transac:
-                transac_process=cached_transac
-            else:
-                save_transac_db(transac_hash,transac)
-                transac_process=transac
-            
-            inputs,outputs=get_inputs_ouputs(transac_process)
-            save_transaction_inout(transac_hash,inputs,outputs)
-
-        
-
+    for inputs,outputs in iter_address_inout(address_str,limit):
         if any(o["address"]==address for o in outputs):
             for input in inputs:
                 src=input["address"]
                 if src!=address:
-                    ver=verify_name(src)
+                    ver=verify_name(address_index.address(src))
                     if "name" in ver:
                         # print(ver)
                         continue
@@ -156,7 +596,7 @@ def explore_address(relations,address,cercle,addrSeen,addrList,futurList,limit):
             for output in outputs:
                 target=output["address"]
                 if target!=address:
-                    ver=verify_name(target)
+                    ver=verify_name(address_index.address(target))
                     if "name" in ver:
                         # print(ver)
                         continue
@@ -175,84 +615,109 @@ def explore_address(relations,address,cercle,addrSeen,addrList,futurList,limit):
 
     return relations,futurList
 
-def risk_score(addr_relations,nb_cercles):
-    score=0
-    risks=[]
-
-    total_in=addr_relations["amount_in"]
-    total_out=addr_relations["amount_out"]
-    nb_transacs_in=addr_relations["nb_transacs_in"]
-    nb_transacs_out=addr_relations["nb_transacs_out"]
-    nb_sources=len(addr_relations["address_in"])
-    nb_targets=len(addr_relations["address_out"])
-
-    if nb_transacs_in>0:
-        average_amount_in=total_in/nb_transacs_in
-        if average_amount_in<100 and nb_transacs_in>20:
-            score+=20
-            risks.append(f"Structuration suspectée (beaucoup de petites transactions) : avg: {average_amount_in:.2f} KAS, {nb_transacs_in} transacs.")
-    
-    if total_in>0 and total_out>0 and addr_relations["cercle"]!=nb_cercles-1:
-        dispersion_ratio=total_out/total_in
-        if dispersion_ratio>0.9 and nb_transacs_out>15:
-            score+=15
-            risks.append(f"Dispersion rapide ({dispersion_ratio*100:.1f}% des fonds ressortent).")
-
-    if nb_sources>30 or nb_targets>30:
-        score+=15
-        risks.append(f"Beaucoup de relations ({nb_sources} sources, {nb_targets} cibles).")
-    
-    if total_in>10000 and nb_sources<5:
-        score+=10
-        risks.append(f"Concentration suspecte ({total_in:.0f} KAS venant de {nb_sources} sources).")
-
-    if nb_transacs_in>0:
-        transac_ratio=nb_transacs_out/nb_transacs_in
-        if transac_ratio>5:
-            score+=10
-            risks.append(f"Hub de distribution ({nb_transacs_in} sources, {nb_transacs_out} sorties donc {transac_ratio:.1f}x plus de sorties que d'entrées).")
-    
-    nb_round_amount=0
-    for addr_data in addr_relations["address_out"].values():
-        amount=addr_data["amount"]
-        if amount%10==0:
-            nb_round_amount+=1
-    
-    if nb_round_amount>10:
-        score+=10
-        risks.append(f"Montants ronds suspects (sûrement automatiques) : {nb_round_amount} transactions rondes.")
-    
-    if total_in>100000 or total_out>100000:
-        score+=10
-        risks.append(f"Montants élevés (en entrée :{total_in:.0f} KAS -> {total_in*0.02809:.2f} € / en sortie :{total_out:.0f} KAS -> {total_out*0.02809:.2f} €).")
-    
-    score=min(score,100)
-
-    if score<20:
-        risk_level="FAIBLE"
-        risk_color="#4CAF50"
-    elif score <40:
-        risk_level="MODÉRÉ"
-        risk_color="#FF9800"
-    elif score<60:
-        risk_level="ÉLEVÉ"
-        risk_color="#FF5722"
+def risk_scores(relations,nb_cercles,rules=None):
+    # Scores de tout le graphe en un passage vectorisé : caractéristiques en colonnes (une case par
+    # adresse), évaluées par les règles déclaratives de risk_rules.json (ou du fichier `rules`, cf. KaspaRules)
+    import numpy as np
+    from KaspaCSR import SOMPI,to_sompi
+    from KaspaRules import load_rules,derive,is_round_amount
+    ruleset=load_rules(rules)
+    addrs=list(relations)
+    datas=list(relations.values())
+    n=len(datas)
+    def column(key,dtype=np.float64,f=None):
+        values=map(itemgetter(key),datas)
+        return np.fromiter(values if f is None else map(f,values),dtype,n)
+    # Montants arrondis au sompi, comme dans un export CSR : KaspaRules.rescore donne les mêmes scores
+    features={"total_in":to_sompi(column("amount_in"))/SOMPI,"total_out":to_sompi(column("amount_out"))/SOMPI,
+              "nb_transacs_in":column("nb_transacs_in",np.int64),"nb_transacs_out":column("nb_transacs_out",np.int64),
+              "nb_sources":column("address_in",np.int64,len),"nb_targets":column("address_out",np.int64,len),
+              "cercle":column("cercle",np.int64)}
+    if "nb_round_amount" in ruleset.features:
+        # montants ronds : seul passage arête par arête. nb_round_amount <= nb_targets, donc si les règles
+        # ne s'en servent qu'au-delà d'un seuil, seules les adresses qui ont plus de cibles sont comptées
+        floor=ruleset.floor("nb_round_amount")
+        many=np.flatnonzero(features["nb_targets"]>floor) if floor is not None else np.arange(n)
+        targets=features["nb_targets"][many]
+        amounts=to_sompi(np.fromiter(chain.from_iterable(map(itemgetter("amount"),datas[i]["address_out"].values()) for i in many.tolist()),
+                                     np.float64,int(targets.sum())))
+        owners=np.repeat(many,targets)
+        features["nb_round_amount"]=np.bincount(owners[is_round_amount(amounts)],minlength=n)
+    return ruleset.results(addrs,derive(features,nb_cercles))
+
+def risk_score(addr_relations,nb_cercles,rules=None):
+    # Une seule adresse (notebooks) : mêmes règles que risk_scores
+    return risk_scores({0:addr_relations},nb_cercles,rules)[0]
+
+def decode_relations(relations):
+    # Identifiants -> adresses : les chaînes ne sont reconstituées qu'au rendu
+    name=address_index.address
+    return {name(addr):{**data,"address_in":{name(a):v for a,v in data["address_in"].items()},
+                        "address_out":{name(a):v for a,v in data["address_out"].items()}}
+            for addr,data in relations.items()}
+
+def load_relation(relation):
+    # Relation relue depuis JSON : les clés (identifiants) y sont devenues des chaînes
+    relation["address_in"]={as_id(a):v for a,v in relation["address_in"].items()}
+    relation["address_out"]={as_id(a):v for a,v in relation["address_out"].items()}
+    return relation
+
+def as_id(key):
+    # Identifiant relu de SQLite / JSON (entier ou texte)
+    return int(key)
+
+def export_csr(relations,path,initial_address,nb_cercles,limit):
+    # Graphe exploré en tableaux CSR (.npy) : rechargeable par KaspaCSR.load_csr sans re-parcours
+    from KaspaCSR import relations_to_csr,save_csr
+    meta=save_csr(path,relations_to_csr(relations,address_index.address),initial_address=initial_address,nb_cercles=nb_cercles,limit=limit)
+    print(f"Graphe exporté (CSR) : {path} ({meta['nb_nodes']} adresses, {meta['nb_edges_out']} arêtes sortantes)")
+
+def iter_crawl_transacs(relations,limit):
+    # Transactions vues pendant le parcours (les `limit` plus récentes de chaque adresse explorée),
+    # dans l'ordre chronologique, au format de build_inout (identifiants d'address_index)
+    hashes={}
+    for address in relations:
+        rows=db.execute('SELECT transac_hash,block_time FROM address_transacs WHERE address = ? ORDER BY block_time DESC,transac_hash LIMIT ?',
+                        (address_index.address(address),limit or -1)).fetchall()
+        hashes.update(rows)
+    for transac_hash in sorted(hashes,key=lambda h:(hashes[h] or 0,h)):
+        inputs,outputs=get_inout_db(transac_hash)
+        if inputs is not None:
+            yield inputs,outputs
+
+def compute_taint(relations,initial_address,limit,policy):
+    # Part des fonds de l'adresse initiale parvenue à chaque adresse (cf. KaspaTaint), clés = adresses
+    import KaspaTaint
+    seed=address_index.id(initial_address)
+    if policy=="fifo":
+        taint=KaspaTaint.taint_fifo(iter_crawl_transacs(relations,limit),seed)
     else:
-        risk_level="CRITIQUE"
-        risk_color="#F44336"
+        taint=KaspaTaint.taint_relations(relations,seed,policy)
+    print(f"Teinte ({policy}) : {sum(1 for t in taint.values() if t['taint']>0)} adresses atteintes")
+    return {address_index.address(addr):t for addr,t in taint.items()}
 
-    return {"score":score,"level":risk_level,"color":risk_color,"risks":risks}
+def taint_color(taint):
+    if taint<=0:
+        return "#607D8B"
+    if taint<0.1:
+        return "#4CAF50"
+    if taint<0.5:
+        return "#FF9800"
+    if taint<0.9:
+        return "#FF5722"
+    return "#F44336"
 
-def create_vis(relations, initial_address,nb_cercles,limit):
+def create_vis(relations, initial_address,nb_cercles,limit,rules=None,taint=None,taint_policy=None):
+    from pyvis.network import Network
+    relations=decode_relations(relations)
     net=Network(height="900px", width="100%", bgcolor="#222222", font_color="white", directed=True)
     net.barnes_hut(gravity=-10000,central_gravity=0.3,spring_length=250,spring_strength=0.01)
     colors=["#FF0000","#FFA500","#FFFF00","#800080","#00FF00","#00FFFF","#FF00FF"]
 
-    risk_dict={}
+    risk_dict=risk_scores(relations,nb_cercles,rules)
     for addr in relations:
         data=relations[addr]
 
-        risk_dict[addr]=risk_score(data,nb_cercles)
         risk=risk_dict[addr]
         color_risk=risk["color"]
 
@@ -273,7 +738,14 @@ def create_vis(relations, initial_address,nb_cercles,limit):
         {chr(10).join(["-" + f for f in risk["risks"]]) if risk["risks"] else "- Aucun indicateur détecté"}
         '''
 
-        net.add_node(addr,label=addr[:10]+"...",title=titleNode,color=color_relations,color_relations=color_relations,color_risk=color_risk,cercle=data["cercle"],risk_score=risk["score"],size=size)
+        extra={}
+        if taint is not None:
+            node_taint=taint.get(addr,{"taint":0.0,"amount":0.0})
+            titleNode+=f'''TEINTE ({taint_policy}) : {node_taint["taint"]*100:.2f} % ({node_taint["amount"]:.2f} KAS issus de l'adresse initiale)
+        '''
+            extra={"taint":round(node_taint["taint"],6),"color_taint":taint_color(node_taint["taint"])}
+
+        net.add_node(addr,label=addr[:10]+"...",title=titleNode,color=color_relations,color_relations=color_relations,color_risk=color_risk,cercle=data["cercle"],risk_score=risk["score"],size=size,**extra)
 
     edge_id=0
     edges_seen=set()
@@ -638,7 +1110,7 @@ def create_vis(relations, initial_address,nb_cercles,limit):
     with open(path, "r", encoding="utf-8") as f:
         content = f.read()
     
-    new_content=content.replace("<body>", "<body>" + injection_ui)
+    new_content=content.replace("<body>", "<body>" + injection_ui + (taint_ui(taint_policy) if taint is not None else ""))
     
     with open(path, "w", encoding="utf-8") as f:
         f.write(new_content)
@@ -646,36 +1118,589 @@ def create_vis(relations, initial_address,nb_cercles,limit):
     print(f"Graphique interactif généré : {path}")
     
 
-def main(initial_address,nb_cercles,limit):
-    relations={}
-    addrSeen=[]
-    addrList=[initial_address]
-    for cercle in range(nb_cercles):
-        print("cercle: ",cercle)
+def taint_ui(policy):
+    # Bouton "Mode TEINTE" ajouté aux contrôles de create_vis : couleurs, filtres et légende par teinte
+    return f"""
+    <script type="text/javascript">
+        var taintMode = false;
+        var taintLevels = [["#607D8B", "Non atteinte (0 %)"], ["#4CAF50", "< 10 %"], ["#FF9800", "10-50 %"], ["#FF5722", "50-90 %"], ["#F44336", "90 %+"]];
+
+        (function() {{
+            var btn = document.createElement('button');
+            btn.id = 'toggleTaintBtn';
+            btn.innerText = 'Mode TEINTE ({policy})';
+            btn.onclick = toggleTaintMode;
+            btn.style.cssText = 'padding: 12px 24px; font-size: 16px; font-weight: bold; background-color: #795548; color: white; border: none; border-radius: 8px; cursor: pointer; box-shadow: 0 4px 6px rgba(0,0,0,0.3); width: 250px;';
+            var controls = document.getElementById('rightControls');
+            controls.insertBefore(btn, document.getElementById('filterPanel'));
+        }})();
+
+        function toggleTaintMode() {{
+            taintMode = !taintMode;
+            var btn = document.getElementById('toggleTaintBtn');
+            nodes.update(nodes.get().map(function(node) {{
+                return {{id: node.id, color: taintMode ? node.color_taint : (riskMode ? node.color_risk : node.color_relations)}};
+            }}));
+            if (!taintMode) {{
+                btn.innerText = 'Mode TEINTE ({policy})';
+                filterByTaint(0);
+                updateFilterPanel();
+                updateLegend();
+                return;
+            }}
+            btn.innerText = 'Quitter le mode TEINTE';
+            document.getElementById('filterPanel').innerHTML = `
+                <p style="margin: 0 0 8px 0; font-weight: bold; color: white; font-size: 14px; text-align: center; border-bottom: 1px solid #555; padding-bottom: 5px;">Filtrer par Teinte</p>
+                <button onclick="filterByTaint(0)" style="width: 100%; padding: 8px; margin-bottom: 5px; background: #607D8B; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 13px;">Toutes</button>
+                <button onclick="filterByTaint(0.000001)" style="width: 100%; padding: 8px; margin-bottom: 5px; background: #4CAF50; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 13px;">Atteintes (&gt; 0 %)</button>
+                <button onclick="filterByTaint(0.1)" style="width: 100%; padding: 8px; margin-bottom: 5px; background: #FF9800; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 13px;">10 %+</button>
+                <button onclick="filterByTaint(0.5)" style="width: 100%; padding: 8px; margin-bottom: 5px; background: #FF5722; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 13px;">50 %+</button>
+                <button onclick="filterByTaint(0.9)" style="width: 100%; padding: 8px; background: #F44336; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 13px;">90 %+</button>
+            `;
+            document.getElementById('legendContent').innerHTML = '<p style="margin: 0 0 8px 0; font-weight: bold; font-size: 14px;">Teinte ({policy}):</p>' +
+                taintLevels.map(function(level) {{
+                    return '<div style="display: flex; align-items: center; margin-bottom: 8px;"><span style="width: 24px; height: 24px; background-color: ' + level[0] +
+                           '; display: inline-block; margin-right: 12px; border-radius: 4px;"></span><span>' + level[1] + '</span></div>';
+                }}).join('');
+        }}
+
+        // Filtrer par teinte minimale (mode Teinte)
+        function filterByTaint(minTaint) {{
+            nodes.update(nodes.get().map(function(node) {{
+                return {{id: node.id, hidden: (node.taint || 0) < minTaint}};
+            }}));
+        }}
+
+        // Le passage en mode Risque / Relations quitte le mode Teinte
+        var toggleModeBase = toggleMode;
+        toggleMode = function() {{
+            if (taintMode) {{
+                toggleTaintMode();
+            }}
+            toggleModeBase();
+        }};
+    </script>
+    """
+
+async def prefetch_cercle(addrList,addrSeen,limit,concurrency):
+    # Synchronise en parallèle (au plus `concurrency` requêtes à la fois) les noms et
+    # transactions d'un cercle. SQLite reste sur le thread principal : seuls les appels
+    # HTTP partent dans des threads. Le passage séquentiel d'explore_address qui suit
+    # garde donc exactement le même ordre et les mêmes relations.
+    import asyncio
+    sem=asyncio.Semaphore(concurrency)
+
+    async def fetch(fn,*args):
+        async with sem:
+            return await asyncio.to_thread(fn,*args)
+
+    # addrList/addrSeen : identifiants ; l'API et la table names travaillent sur les chaînes
+    to_explore={address_index.address(a):a for a in dict.fromkeys(addrList) if a not in addrSeen}
+    await fetch_names_async(list(to_explore),fetch)
+    to_explore={a:i for a,i in to_explore.items() if "name" not in verify_name(a)}
+
+    # Les threads remettent leurs transactions page par page (PAGE_SIZE) au thread principal, qui
+    # les enregistre au fil de l'eau : la mémoire reste bornée à quelques pages par cercle. File
+    # bornée : un thread attend que sa page soit prise avant de lire la suivante.
+    loop=asyncio.get_running_loop()
+    pages=asyncio.Queue(concurrency)
+    stop=threading.Event()
+
+    def fetch_delta(address,sync,known):
+        def hand(page):
+            if stop.is_set():
+                raise RuntimeError("Préchargement du cercle interrompu")
+            asyncio.run_coroutine_threadsafe(pages.put((address,page)),loop).result()
+        try:
+            page=[]
+            for transac in fetch_address_delta(address,limit,sync,known):
+                page.append(transac)
+                if len(page)>=PAGE_SIZE:
+                    hand(page)
+                    page=[]
+            hand(page)
+        except BaseException:
+            if not stop.is_set():
+                hand(None)
+            raise
+        hand(True)
+
+    syncs={a:get_sync_db(a) for a in to_explore}
+    tasks=[asyncio.ensure_future(fetch(fetch_delta,a,syncs[a],get_known_hashes(a))) for a in to_explore]
+    remaining=len(tasks)
+    try:
+        while remaining:
+            if pages.empty():
+                # rien à écrire en attendant le réseau : le lot en cours est validé
+                db.release()
+            address,page=await pages.get()
+            if page is True:
+                save_sync_db(address,syncs[address])
+                remaining-=1
+            elif page is None:
+                remaining-=1  # erreur du thread, remontée ci-dessous
+            else:
+                save_address_page(address,page)
+    except BaseException:
+        # Erreur côté thread principal : on vide la file jusqu'à l'arrêt des threads
+        stop.set()
+        while not all(task.done() for task in tasks):
+            while not pages.empty():
+                pages.get_nowait()
+            await asyncio.sleep(0.05)
+        await asyncio.gather(*tasks,return_exceptions=True)
+        raise
+    for result in await asyncio.gather(*tasks,return_exceptions=True):
+        if isinstance(result,BaseException):
+            raise result
+    db.commit()
+
+    counterparts=[]
+    for address,address_id in to_explore.items():
+        for inputs,outputs in iter_address_inout(address,limit):
+            # mêmes adresses que celles vérifiées par explore_address
+            if any(o["address"]==address_id for o in outputs):
+                counterparts.extend(i["address"] for i in inputs if i["address"]!=address_id)
+            if any(i["address"]==address_id for i in inputs):
+                counterparts.extend(o["address"] for o in outputs if o["address"]!=address_id)
+    # mode "bulk" : tous les noms des contreparties du cercle en un seul lot
+    await fetch_names_async([address_index.address(a) for a in dict.fromkeys(counterparts)],fetch)
+    return set(to_explore.values())
+
+def delete_orphan_transacs():
+    # Transactions qui ne sont plus rattachées à aucune adresse synchronisée
+    db.execute('DELETE FROM tx WHERE hash NOT IN (SELECT transac_hash FROM address_transacs)')
+    db.execute('DELETE FROM tx_input WHERE tx_hash NOT IN (SELECT hash FROM tx)')
+    # Sorties seules (transactions précédentes, cf. save_outputs) : gardées tant qu'une entrée les dépense
+    db.execute('''DELETE FROM tx_output WHERE tx_hash NOT IN (SELECT hash FROM tx)
+                  AND tx_hash NOT IN (SELECT prev_hash FROM tx_input WHERE prev_hash IS NOT NULL)''')
+
+def expire_cache():
+    # Supprime les entrées dont la durée de vie est dépassée. Les transactions (tx/tx_input/tx_output)
+    # n'expirent pas : elles suivent les adresses synchronisées (cf. evict_cache).
+    now=time.time()
+    nb={"names":0,"checkpoints":0}
+    if NAMES_TTL_DAYS>0:
+        nb["names"]=db.execute('DELETE FROM names WHERE fetched_at IS NULL OR fetched_at < ?',(now-NAMES_TTL_DAYS*86400,)).rowcount
+        names_cache.data.clear()
+    if CHECKPOINTS_TTL_DAYS>0:
+        runs=db.execute('SELECT run_id FROM crawl_runs WHERE done = 1 AND updated_at < ?',(now-CHECKPOINTS_TTL_DAYS*86400,)).fetchall()
+        for (run_id,) in runs:
+            reset_checkpoint(run_id)
+        nb["checkpoints"]=len(runs)
+    # parcours distribués terminés : le coordinateur a déjà relu leurs résultats
+    db.execute("DELETE FROM work_queue WHERE run_id IN (SELECT run_id FROM work_runs WHERE status = 'done')")
+    db.execute("DELETE FROM work_runs WHERE status = 'done'")
+    db.flush()
+    return nb
+
+def evict_cache(max_mb=CACHE_MAX_MB):
+    # Taille max : on oublie les adresses synchronisées le moins récemment (LRU sur synced_at)
+    # et les transactions qui ne sont plus rattachées à aucune adresse. La place libérée est
+    # mesurée en pages occupées ; à l'appelant de compacter ensuite (un seul VACUUM).
+    # Une adresse oubliée sera simplement resynchronisée au prochain parcours.
+    nb=0
+    while max_mb and db.used_size()>max_mb*1e6:
+        nb_addresses=db.execute('SELECT COUNT(*) FROM address_sync').fetchone()[0]
+        if nb_addresses==0:
+            break
+        # part du fichier à libérer (+10 % de marge), appliquée au nombre d'adresses
+        to_evict=max(EVICT_BATCH,int(nb_addresses*(1.1-max_mb*1e6/db.used_size())))
+        addresses=db.execute('SELECT address FROM address_sync ORDER BY synced_at LIMIT ?',(to_evict,)).fetchall()
+        db.executemany('DELETE FROM address_transacs WHERE address = ?',addresses)
+        db.executemany('DELETE FROM address_sync WHERE address = ?',addresses)
+        delete_orphan_transacs()
+        nb+=len(addresses)
+    return nb
+
+def maintain_cache():
+    # Commande de maintenance (--vacuum) : expiration, taille max puis VACUUM
+    size_before=os.path.getsize(CACHE_FILE)
+    nb=expire_cache()
+    nb_evicted=evict_cache()
+    db.vacuum()
+    print(f"Expirés : {nb['names']} noms, {nb['checkpoints']} points de reprise")
+    print(f"Adresses évincées (taille max) : {nb_evicted}")
+    print(f"Cache : {size_before/1e6:.1f} Mo -> {os.path.getsize(CACHE_FILE)/1e6:.1f} Mo")
+
+def get_run_id(initial_address,nb_cercles,limit):
+    return f"{initial_address}|{nb_cercles}|{limit}"
+
+def reset_checkpoint(run_id):
+    for table in ("crawl_runs","crawl_relations","crawl_seen","crawl_futur"):
+        db.execute(f'DELETE FROM {table} WHERE run_id = ?',(run_id,))
+
+def save_checkpoint_cercle(run_id,cercle,addrList,done=False):
+    db.execute('INSERT OR REPLACE INTO crawl_runs (run_id,cercle,addr_list,done,updated_at) VALUES (?,?,?,?,?)',
+               (run_id,cercle,json.dumps(addrList),int(done),time.time()))
+    db.execute('DELETE FROM crawl_futur WHERE run_id = ?',(run_id,))
+
+def save_checkpoint_address(run_id,relations,address,futurList,nb_saved):
+    # Écrit uniquement ce qui a changé depuis le dernier point : la relation de l'adresse,
+    # son passage dans addrSeen et les nouvelles entrées de futurList. Renvoie le nb d'entrées sauvées.
+    if address in relations:
+        db.write('INSERT OR REPLACE INTO crawl_relations (run_id,address,pos,data) VALUES (?,?,?,?)',
+                 (run_id,address,len(relations)-1,json.dumps(relations[address])))
+    db.write('INSERT OR IGNORE INTO crawl_seen (run_id,address) VALUES (?,?)',(run_id,address))
+    db.write_many('INSERT OR REPLACE INTO crawl_futur (run_id,seq,address) VALUES (?,?,?)',
+                  [(run_id,seq,a) for seq,a in enumerate(futurList[nb_saved:],nb_saved)])
+    return len(futurList)
+
+def load_checkpoint(run_id):
+    row=db.execute('SELECT cercle,addr_list,done FROM crawl_runs WHERE run_id = ?',(run_id,)).fetchone()
+    if not row:
+        return None
+    relations={as_id(address):load_relation(json.loads(data)) for address,data in db.execute('SELECT address,data FROM crawl_relations WHERE run_id = ? ORDER BY pos',(run_id,)).fetchall()}
+    addrSeen={as_id(address) for (address,) in db.execute('SELECT address FROM crawl_seen WHERE run_id = ?',(run_id,)).fetchall()}
+    futurList=[as_id(address) for (address,) in db.execute('SELECT address FROM crawl_futur WHERE run_id = ? ORDER BY seq',(run_id,)).fetchall()]
+    return {"cercle":row[0],"addrList":[as_id(a) for a in json.loads(row[1])],"done":bool(row[2]),
+            "relations":relations,"addrSeen":addrSeen,"futurList":futurList}
+
+def crawl_bfs(initial_address,nb_cercles,limit,concurrency=1,resume=False):
+    run_id=get_run_id(initial_address,nb_cercles,limit)
+    checkpoint=load_checkpoint(run_id) if resume else None
+    if checkpoint:
+        print(f"Reprise au cercle {checkpoint['cercle']} ({len(checkpoint['relations'])} adresses déjà explorées)")
+        relations=checkpoint["relations"]
+        addrSeen=checkpoint["addrSeen"]
+        addrList=checkpoint["addrList"]
+        futurList=checkpoint["futurList"]
+        start=nb_cercles if checkpoint["done"] else checkpoint["cercle"]
+    else:
+        reset_checkpoint(run_id)
+        relations={}
+        addrSeen=set()
+        addrList=[address_index.id(initial_address)]
         futurList=[]
+        start=0
+        save_checkpoint_cercle(run_id,0,addrList)
+        db.flush()
+    for cercle in range(start,nb_cercles):
+        print("cercle: ",cercle)
+        nb_saved=len(futurList)
+        prefetched=set()
+        if concurrency>1:
+            import asyncio
+            prefetched=asyncio.run(prefetch_cercle(addrList,addrSeen,limit,concurrency))
         i=0
         for addr in addrList:
             if addr not in addrSeen:
-                ver_name=verify_name(addr)
+                ver_name=verify_name(address_index.address(addr))
                 if "name" in ver_name.keys():
                     print("Adresse ignorée : ",ver_name)
-                    addrSeen.append(addr)
+                    addrSeen.add(addr)
+                    nb_saved=save_checkpoint_address(run_id,relations,addr,futurList,nb_saved)
                     continue
 
-                print("expl: ",addr)
-                relations,futurList=explore_address(relations,addr,cercle,addrSeen,addrList,futurList,limit)
-                conn.commit()
-                addrSeen.append(addr)
+                print("expl: ",address_index.address(addr))
+                relations,futurList=explore_address(relations,addr,cercle,addrSeen,addrList,futurList,limit,addr in prefetched)
+                addrSeen.add(addr)
+                nb_saved=save_checkpoint_address(run_id,relations,addr,futurList,nb_saved)
+                db.commit()
                 i+=1
                 print("Nb addr restantes :",len(addrList)-i)
-            
-        addrList=list(set(futurList))
+
+        # futurList est déjà sans doublon : on garde l'ordre de découverte pour que
+        # deux exécutions (séquentielle ou concurrente) produisent le même graphe
+        addrList=list(dict.fromkeys(futurList))
+        futurList=[]
         print(len(addrList))
+        save_checkpoint_cercle(run_id,cercle+1,addrList,done=cercle+1>=nb_cercles)
+        db.commit()
+    return relations
+
+def api_calls():
+    # Appels API logiques : requêtes HTTP hors nouvelles tentatives, plus celles servies par --replay
+    stats=client.stats
+    return stats["requests"]-stats["retries"]+stats["replayed"]
+
+def crawl_priority(initial_address,nb_cercles,limit,max_addresses=None,max_api_calls=None,max_time=None):
+    # Frontière à priorité : on explore d'abord les adresses qui ont échangé le plus de KAS avec
+    # les adresses déjà explorées, dans la limite des budgets (adresses, appels API logiques, durée).
+    # Le score d'une adresse est le montant échangé (dans les deux sens) avec les adresses
+    # explorées ; son cercle reste sa distance (en sauts) à l'adresse initiale dans le graphe
+    # découvert : un raccourci trouvé plus tard rapproche l'adresse et, de proche en proche, ses
+    # voisines (une adresse explorée qui passe sous nb_cercles voit alors ses voisines ajoutées).
+    relations={}
+    initial_id=address_index.id(initial_address)
+    cercles={initial_id:0}
+    scores={initial_id:float("inf")}
+    frontier=[(-scores[initial_id],0,initial_id)]
+    seen=set()
+    expanded=set()
+    seq=1
+    start_calls=api_calls()
+    deadline=time.monotonic()+max_time if max_time else None
+
+    def expand(addr):
+        # Voisines d'une adresse explorée : ajout à la frontière (première fois) et mise à jour des
+        # cercles ; rend les adresses explorées dont le cercle vient de diminuer
+        nonlocal seq
+        cercle=cercles[addr]
+        if cercle+1>=nb_cercles:
+            return []
+        first=addr not in expanded
+        expanded.add(addr)
+        data=relations[addr]
+        flows={}
+        for neighbor,info in list(data["address_out"].items())+list(data["address_in"].items()):
+            flows[neighbor]=flows.get(neighbor,0)+info["amount"]
+        shortened=[]
+        for neighbor,flow in flows.items():
+            shorter=cercle+1<cercles.get(neighbor,nb_cercles)
+            if shorter:
+                cercles[neighbor]=cercle+1
+            if neighbor in relations:
+                if shorter:
+                    relations[neighbor]["cercle"]=cercle+1
+                    shortened.append(neighbor)
+            elif neighbor not in seen and first:
+                scores[neighbor]=scores.get(neighbor,0)+flow
+                heapq.heappush(frontier,(-scores[neighbor],seq,neighbor))
+                seq+=1
+        return shortened
+
+    while frontier:
+        if max_addresses is not None and len(relations)>=max_addresses:
+            print("Budget d'adresses atteint")
+            break
+        if max_api_calls is not None and api_calls()-start_calls>=max_api_calls:
+            print("Budget d'appels API atteint")
+            break
+        if deadline is not None and time.monotonic()>=deadline:
+            print("Temps imparti écoulé")
+            break
+
+        neg_score,_,addr=heapq.heappop(frontier)
+        if addr in seen or -neg_score!=scores[addr]:
+            continue  # entrée périmée : l'adresse a été repoussée avec un meilleur score
+        seen.add(addr)
+        ver_name=verify_name(address_index.address(addr))
+        if "name" in ver_name.keys():
+            print("Adresse ignorée : ",ver_name)
+            continue
+
+        cercle=cercles[addr]
+        print(f"expl (cercle {cercle}, {-neg_score:.2f} KAS): ",address_index.address(addr))
+        relations,_=explore_address(relations,addr,cercle,[],[],[],limit)
+        db.commit()
+
+        # Son historique peut la relier directement à une adresse explorée plus proche
+        data=relations[addr]
+        cercle=min([cercle]+[cercles[n]+1 for n in list(data["address_out"])+list(data["address_in"]) if n in relations])
+        cercles[addr]=data["cercle"]=cercle
+        pending=[addr]
+        while pending:
+            pending.extend(expand(pending.pop()))
+    db.flush()
+    return relations
+
+def retry_locked(fn,*args):
+    # "database is locked" : un autre processus a gardé le verrou d'écriture plus longtemps que le
+    # timeout de connexion ; on annule la transaction et on réessaie après une pause croissante
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt==LOCK_RETRIES-1:
+                raise
+            print(f"Cache verrouillé ({e}), nouvel essai")
+            db.rollback()
+            time.sleep(2**attempt)
+
+def claim_task(worker):
+    # Réservation atomique (un seul UPDATE) d'une adresse en attente ou dont le bail a expiré
+    now=time.time()
+    row=db.execute('''UPDATE work_queue SET status='claimed',worker=?,lease_until=?,attempts=attempts+1
+                      WHERE rowid=(SELECT q.rowid FROM work_queue q JOIN work_runs r ON r.run_id=q.run_id
+                                   WHERE r.status='running' AND (q.status='pending' OR (q.status='claimed' AND q.lease_until<?))
+                                   ORDER BY q.seq LIMIT 1)
+                      RETURNING run_id,address,cercle,attempts''',(worker,now+LEASE_TIME,now)).fetchone()
+    if row is None:
+        db.flush()
+        return None
+    lim=db.execute('SELECT lim FROM work_runs WHERE run_id = ?',(row[0],)).fetchone()[0]
+    db.flush()
+    return {"run_id":row[0],"address":as_id(row[1]),"cercle":row[2],"attempts":row[3],"limit":lim}
+
+def complete_task(task,worker,status,result):
+    # Le résultat n'est accepté que si le bail appartient encore à ce worker
+    cur=db.execute('''UPDATE work_queue SET status=?,result=?,lease_until=NULL
+                      WHERE run_id=? AND address=? AND worker=? AND status='claimed' ''',
+                   (status,json.dumps(result),task["run_id"],task["address"],worker))
+    db.flush()
+    return cur.rowcount==1
+
+def explore_task(task):
+    # Aucune transaction ouverte pendant les appels réseau (chaque requête commence par
+    # db.release()) : les pages sont validées au fil de l'eau et les workers écrivent en parallèle
+    address=task["address"]
+    ver_name=verify_name(address_index.address(address))
+    if "name" in ver_name.keys():
+        return {"name":ver_name}
+    relations,futurList=explore_address({},address,task["cercle"],set(),[address],[],task["limit"])
+    return {"relation":relations[address],"futur":futurList}
+
+def run_worker(idle_timeout=60):
+    worker=f"{socket.gethostname()}:{os.getpid()}"
+    print("Worker démarré :",worker)
+    idle_since=time.monotonic()
+    while True:
+        try:
+            task=retry_locked(claim_task,worker)
+        except sqlite3.OperationalError as e:
+            print(f"ERREUR : réservation impossible - {e}")
+            time.sleep(1)
+            continue
+        if task is None:
+            if db.execute("SELECT COUNT(*) FROM work_runs WHERE status='running'").fetchone()[0]==0 and time.monotonic()-idle_since>idle_timeout:
+                break
+            time.sleep(0.5)
+            continue
+        print("expl: ",address_index.address(task["address"]))
+        try:
+            result=explore_task(task)
+            status="done"
+        except Exception as e:
+            print(f"ERREUR : {task['address']} - {e}")
+            db.rollback()
+            result={"error":str(e)}
+            status="failed" if task["attempts"]>=MAX_ATTEMPTS else "pending"
+        try:
+            retry_locked(complete_task,task,worker,status,result)
+        except sqlite3.OperationalError as e:
+            # le bail expirera et l'adresse sera reprise par un autre worker
+            print(f"ERREUR : résultat non enregistré pour {task['address']} - {e}")
+        idle_since=time.monotonic()
+    print(client.report())
+
+def crawl_distributed(initial_address,nb_cercles,limit,nb_workers=0):
+    # Coordinateur : publie chaque cercle dans la file, attend que les workers l'aient traité,
+    # puis rejoue les résultats dans l'ordre de addrList pour obtenir les mêmes relations
+    # (et le même futurList) qu'un parcours séquentiel.
+    run_id=get_run_id(initial_address,nb_cercles,limit)
+    db.execute('DELETE FROM work_queue WHERE run_id = ?',(run_id,))
+    db.execute('INSERT OR REPLACE INTO work_runs (run_id,lim,status) VALUES (?,?,?)',(run_id,limit,"running"))
+    db.flush()
+    # Archive HTTP : les workers rejouent la même (--replay) ou enregistrent chacun la leur (un seul
+    # écrivain par fichier zip), fusionnée dans celle du coordinateur à la fin (--record)
+    archive=client.archive
+    env={k:v for k,v in os.environ.items() if k not in ("KASPA_HTTP_ARCHIVE","KASPA_HTTP_MODE")}
+    def worker_args(k):
+        args=[sys.executable,os.path.abspath(__file__),"--worker","--idle","5"]
+        if archive:
+            args+=[f"--{archive.mode}",archive.path if archive.mode=="replay" else f"{archive.path}.worker{k}"]
+        return args
+    workers=[subprocess.Popen(worker_args(k),env=env) for k in range(nb_workers)]
+
+    relations={}
+    addrSeen=set()
+    addrList=[address_index.id(initial_address)]
+    seq=0
+    try:
+        for cercle in range(nb_cercles):
+            print("cercle: ",cercle)
+            tasks=[a for a in dict.fromkeys(addrList) if a not in addrSeen]
+            db.executemany('INSERT OR IGNORE INTO work_queue (run_id,address,cercle,seq,status) VALUES (?,?,?,?,?)',
+                           [(run_id,a,cercle,seq+k,"pending") for k,a in enumerate(tasks)])
+            seq+=len(tasks)
+            db.flush()
+            while True:
+                remaining=db.execute("SELECT COUNT(*) FROM work_queue WHERE run_id = ? AND status IN ('pending','claimed')",(run_id,)).fetchone()[0]
+                if remaining==0:
+                    break
+                if workers and all(process.poll() is not None for process in workers):
+                    raise RuntimeError("Tous les workers locaux se sont arrêtés avant la fin du cercle")
+                print("Adresses restantes :",remaining)
+                time.sleep(1)
+
+            results={as_id(address):(status,json.loads(result)) for address,status,result in db.execute('SELECT address,status,result FROM work_queue WHERE run_id = ? AND cercle = ?',(run_id,cercle)).fetchall()}
+            futurList=[]
+            for addr in addrList:
+                if addr in addrSeen:
+                    continue
+                addrSeen.add(addr)
+                status,result=results[addr]
+                if status=="failed":
+                    print(f"ERREUR : {address_index.address(addr)} - {result['error']}")
+                    continue
+                if "name" in result:
+                    print("Adresse ignorée : ",result["name"])
+                    continue
+                relations[addr]=load_relation(result["relation"])
+                for candidate in result["futur"]:
+                    if candidate not in addrList and candidate not in futurList and candidate not in addrSeen:
+                        futurList.append(candidate)
+            addrList=list(dict.fromkeys(futurList))
+            print(len(addrList))
+    finally:
+        db.execute('UPDATE work_runs SET status = ? WHERE run_id = ?',("done",run_id))
+        db.flush()
+        for process in workers:
+            process.wait()
+        if archive and archive.mode=="record":
+            for k in range(nb_workers):
+                path=f"{archive.path}.worker{k}"
+                if os.path.exists(path):
+                    print(f"Archive du worker {k} : {archive.merge(path)} réponses ajoutées à {archive.path}")
+                    os.remove(path)
+    return relations
+
+def main(initial_address,nb_cercles,limit,concurrency=1,strategy="bfs",max_addresses=None,max_api_calls=None,max_time=None,resume=False,nb_workers=0,csr_path=None,write_behind=True,rules=None,taint_policy=None):
+    if write_behind:
+        # Les écritures du cache partent dans un thread dédié pendant les appels réseau
+        db.start_writer()
+    if strategy=="priority":
+        relations=crawl_priority(initial_address,nb_cercles,limit,max_addresses,max_api_calls,max_time)
+    elif strategy=="distributed":
+        relations=crawl_distributed(initial_address,nb_cercles,limit,nb_workers)
+    else:
+        relations=crawl_bfs(initial_address,nb_cercles,limit,concurrency,resume)
     
-    create_vis(relations,initial_address,nb_cercles,limit)
+    db.flush()
+    if CACHE_MAX_MB and db.size()>CACHE_MAX_MB*1e6:
+        print(f"Cache au-delà de {CACHE_MAX_MB:g} Mo : {evict_cache()} adresses évincées")
+        db.vacuum()
+    print(client.report())
+    if csr_path:
+        export_csr(relations,csr_path,initial_address,nb_cercles,limit)
+    taint=compute_taint(relations,initial_address,limit,taint_policy) if taint_policy else None
+    create_vis(relations,initial_address,nb_cercles,limit,rules,taint,taint_policy)
 
 if __name__=="__main__":
     # address="kaspa:qqssy8x2stwk6x7trmw56m8rwfkwul70rpqxrvv789mxqz73pdny2sprry82x"
     address="kaspa:qp2sp0vvrwu4s8pw0j68muu2ta5qar5mehf8ehuvljw5zsrakk5cvx4gvqz7z"
 
-    main(address,nb_cercles=4,limit=50)
\ No newline at end of file
+    parser=argparse.ArgumentParser(description="Arguments")
+    parser.add_argument("--address",type=str,default=address,help="Adresse Kaspa initiale")
+    parser.add_argument("--nbCercles",type=int,default=4,help="Nombre de cercles")
+    parser.add_argument("--limit",type=int,default=50,help="Limite de transactions par adresse (0 = tout l'historique)")
+    parser.add_argument("--concurrency",type=int,default=1,help="Requêtes simultanées par cercle (1 = séquentiel, noms vérifiés un à un ; au-delà, noms résolus par lots)")
+    parser.add_argument("--strategy",choices=["bfs","priority","distributed"],default="bfs",help="Parcours par cercles (bfs), par montants (priority) ou réparti entre workers (distributed)")
+    parser.add_argument("--maxAddresses",type=int,help="Budget : nombre max d'adresses explorées (priority)")
+    parser.add_argument("--maxApiCalls",type=int,help="Budget : nombre max d'appels API logiques, rejoués (--replay) compris, hors nouvelles tentatives (priority)")
+    parser.add_argument("--maxTime",type=float,help="Budget : durée max en secondes (priority)")
+    parser.add_argument("--resume",action="store_true",help="Reprend le parcours (bfs) interrompu au dernier point de sauvegarde")
+    parser.add_argument("--workers",type=int,default=0,help="Nombre de workers locaux lancés par le coordinateur (distributed)")
+    parser.add_argument("--worker",action="store_true",help="Lance un worker qui traite la file de travail du cache partagé")
+    parser.add_argument("--vacuum",action="store_true",help="Purge les entrées expirées du cache, applique KASPA_CACHE_MAX_MB, compacte le fichier puis quitte")
+    parser.add_argument("--syncWrites",action="store_true",help="Écrit le cache sur le thread du parcours (sans thread d'écriture différée)")
+    parser.add_argument("--exportCsr",type=str,help="Exporte aussi le graphe exploré en tableaux CSR (.npy) dans ce dossier")
+    parser.add_argument("--rules",type=str,help="Fichier de règles de risque (défaut : risk_rules.json, ou KASPA_RISK_RULES)")
+    parser.add_argument("--taint",choices=["poison","haircut","fifo"],help="Propage la teinte des fonds de l'adresse initiale (mode TEINTE du graphe)")
+    parser.add_argument("--idle",type=float,default=60,help="Arrêt du worker après N secondes sans parcours en cours")
+    add_archive_args(parser)
+    args=parser.parse_args()
+    open_archive_from_args(args)
+
+    if args.vacuum:
+        maintain_cache()
+        db.close()
+        sys.exit(0)
+    if args.worker:
+        run_worker(args.idle)
+        db.close()
+        sys.exit(0)
+    main(args.address,nb_cercles=args.nbCercles,limit=args.limit,concurrency=args.concurrency,strategy=args.strategy,
+         max_addresses=args.maxAddresses,max_api_calls=args.maxApiCalls,max_time=args.maxTime,resume=args.resume,nb_workers=args.workers,csr_path=args.exportCsr,write_behind=not args.syncWrites,rules=args.rules,taint_policy=args.taint)
+    db.close()
\ No newline at end of file
@@ -1,63 +1,78 @@
-import requests
+from KaspaClient import client,add_archive_args,open_archive_from_args
+from KaspaCache import AddressIndex
 from pyvis.network import Network
 import argparse
 import os
 import math
 import json
 
+# Adresse -> identifiant entier : clés des dictionnaires et identifiants des nœuds,
+# l'adresse n'est reconstituée que pour l'affichage (plus de collision sur les préfixes [:15])
+address_index = AddressIndex()
+
+def merge_transactions(transac, new_transactions, allAddresses, addresses=None):
+    """Agrège les transactions d'une adresse dans `transac` et renvoie les nouvelles contreparties"""
+    # Seules les transactions reçues sont parcourues et allAddresses est un set : le coût ne
+    # dépend que de l'adresse traitée, pas de la taille du graphe déjà construit
+    if addresses is None:
+        addresses = []
+    discovered = set(addresses)
+
+    for transactions in new_transactions:
+        tx_id = transactions.get("transactionId", "unknown")
+        timestamp = transactions.get("blockTime", 0)
+        
+        for input in transactions["inputs"]:
+            incomeAddress = address_index.id(input["previousOutput"]["scriptPublicKeyAddress"])
+            amount = int(input["previousOutput"].get("amount", 0)) / 100000000  # Conversion en KAS
+            
+            if incomeAddress not in transac:
+                transac[incomeAddress] = {}
+            if incomeAddress not in discovered and incomeAddress not in allAddresses:
+                discovered.add(incomeAddress)
+                addresses.append(incomeAddress)
+                
+            for output in transactions["outputs"]:
+                outcomeAddress = address_index.id(output["scriptPublicKeyAddress"])
+                out_amount = int(output.get("amount", 0)) / 100000000
+                
+                if outcomeAddress not in transac[incomeAddress]:
+                    transac[incomeAddress][outcomeAddress] = {
+                        'count': 0,
+                        'total_amount': 0,
+                        'amounts': [],
+                        'timestamps': []
+                    }
+                if outcomeAddress not in discovered and outcomeAddress not in allAddresses:
+                    discovered.add(outcomeAddress)
+                    addresses.append(outcomeAddress)
+                
+                transac[incomeAddress][outcomeAddress]['count'] += 1
+                transac[incomeAddress][outcomeAddress]['total_amount'] += out_amount
+                transac[incomeAddress][outcomeAddress]['amounts'].append(out_amount)
+                transac[incomeAddress][outcomeAddress]['timestamps'].append(timestamp)
+
+    return addresses
+
+
 def make_graph(G, address, limit, allAddresses, transac, addresses=None):
     url = f"https://api.kas.fyi/v1/addresses/{address}/"
     headers = {"x-api-key": API_KEY}
 
-    responseTag = requests.get(url + "tag", headers=headers)
+    responseTag = client.get(url + "tag", headers=headers)
     dataTag = responseTag.json()
 
     if "tag" in dataTag:
         print("Exchange platform", dataTag)
         return G, None, transac
 
-    responseTransac = requests.get(url + f"transactions?limit={limit}", headers=headers)
+    responseTransac = client.get(url + f"transactions?limit={limit}", headers=headers)
     data = responseTransac.json()
 
+    if addresses is None:
+        addresses = []
     try:
-        for transactions in data["transactions"]:
-            tx_id = transactions.get("transactionId", "unknown")
-            timestamp = transactions.get("blockTime", 0)
-            
-            for input in transactions["inputs"]:
-                incomeAddress = input["previousOutput"]["scriptPublicKeyAddress"]
-                amount = int(input["previousOutput"].get("amount", 0)) / 100000000  # Conversion en KAS
-                
-                if incomeAddress not in transac:
-                    transac[incomeAddress] = {}
-                    
-                for output in transactions["outputs"]:
-                    outcomeAddress = output["scriptPublicKeyAddress"]
-                    out_amount = int(output.get("amount", 0)) / 100000000
-                    
-                    if outcomeAddress not in transac[incomeAddress]:
-                        transac[incomeAddress][outcomeAddress] = {
-                            'count': 0,
-                            'total_amount': 0,
-                            'amounts': [],
-                            'timestamps': []
-                        }
-                    
-                    transac[incomeAddress][outcomeAddress]['count'] += 1
-                    transac[incomeAddress][outcomeAddress]['total_amount'] += out_amount
-                    transac[incomeAddress][outcomeAddress]['amounts'].append(out_amount)
-                    transac[incomeAddress][outcomeAddress]['timestamps'].append(timestamp)
-        
-        if addresses is None:
-            addresses = []
-        
-        for income in transac:
-            if income not in addresses and income not in allAddresses:
-                addresses.append(income)
-            for outcome in transac[income]:
-                if outcome not in addresses and outcome not in allAddresses:
-                    addresses.append(outcome)
-                    
+        merge_transactions(transac, data["transactions"], allAddresses, addresses)
     except Exception as e:
         print(f"ERREUR : {address} - {e}")
     
@@ -71,49 +86,48 @@ COLOR_SCHEMES = {
 }
 
 
-def calculate_risk_score(addr_short, transac, node_layer, predecessors, successors):
-    """Calcule un score de risque basé sur plusieurs métriques"""
-    score = 0
-    
-    in_degree = len(predecessors.get(addr_short, []))
-    out_degree = len(successors.get(addr_short, []))
-    
-    if out_degree > 20:  # Fan-out suspect
-        score += 3
-    elif out_degree > 10:
-        score += 2
-    elif out_degree > 5:
-        score += 1
-    
-    if in_degree > 20:  # Fan-in suspect
-        score += 3
-    elif in_degree > 10:
-        score += 2
-    
-    for outcome in successors.get(addr_short, []):
-        for full_addr in transac:
-            if full_addr[:15] == addr_short:
-                for full_outcome in transac[full_addr]:
-                    if full_outcome[:15] == outcome:
-                        tx_count = transac[full_addr][full_outcome]['count']
-                        if tx_count > 10:
-                            score += 2
-                        elif tx_count > 5:
-                            score += 1
-    
-    layer = node_layer.get(addr_short, 0)
-    if 2 <= layer <= 4:  # Couches intermédiaires = layering potentiel
-        score += 1
-    
-    total_connections = in_degree + out_degree
-    if total_connections > 30:
-        score += 2
-    
-    return min(score, 7)  # Score max = 7
+def tx_count_score(count):
+    # Arête répétée : nombreuses transactions vers la même cible
+    if count > 10:
+        return 2
+    elif count > 5:
+        return 1
+    return 0
+
+
+def calculate_risk_scores(nodes, transac, node_layer, rules=None):
+    """Scores de risque de tous les nœuds, en un seul passage sur les arêtes de `transac`
+
+    Règles : section "pyvis" de risk_rules.json (ou du fichier `rules`), cf. KaspaRules.
+    """
+    import numpy as np
+    from KaspaRules import load_rules
+
+    in_degree = {}
+    out_degree = {}
+    count_score = {}
+    for income, outcomes in transac.items():
+        out_degree[income] = len(outcomes)
+        score = 0
+        for outcome, tx_data in outcomes.items():
+            in_degree[outcome] = in_degree.get(outcome, 0) + 1
+            score += tx_count_score(tx_data['count'])
+        count_score[income] = score
+    ruleset = load_rules(rules, section="pyvis")
+    nodes = list(nodes)
+
+    def column(values):
+        return np.fromiter((values.get(addr, 0) for addr in nodes), np.int64, len(nodes))
+
+    features = {"in_degree": column(in_degree), "out_degree": column(out_degree),
+                "tx_count_score": column(count_score), "layer": column(node_layer)}
+    features["total_connections"] = features["in_degree"] + features["out_degree"]
+    scores, _ = ruleset.evaluate(features)
+    return dict(zip(nodes, scores.tolist()))
 
 
 def main(args):
-    outcome = args.address
+    outcome = address_index.id(args.address)
     nb_cercles = args.nbCercles
 
     
@@ -139,18 +153,16 @@ def main(args):
         next_level = []
         
         for addr in current_level:
-            print(f"  Traitement: {addr[:15]}...")
-            _, outcomes, transac = make_graph(None, addr, limit=args.limit, 
-                                             allAddresses=list(allAddresses), 
+            print(f"  Traitement: {address_index.address(addr)[:15]}...")
+            _, outcomes, transac = make_graph(None, address_index.address(addr), limit=args.limit, 
+                                             allAddresses=allAddresses, 
                                              transac=transac)
             
             if outcomes is not None:
                 for outcome_addr in outcomes:
-                    outcome_short = outcome_addr[:15]
-                    
                     if outcome_addr not in allAddresses:
                         allAddresses.add(outcome_addr)
-                        node_layer[outcome_short] = cercle + 1
+                        node_layer[outcome_addr] = cercle + 1
                         next_level.append(outcome_addr)
         
         print(f"  Total adresses découvertes: {len(allAddresses)}")
@@ -164,28 +176,15 @@ def main(args):
     predecessors = {}
     successors = {}
     
+    # Clés de transac et de transac[income] uniques : pas de test d'appartenance sur les listes
     for income in transac:
-        income_short = income[:15]
-        if income_short not in successors:
-            successors[income_short] = []
-            
+        successors[income] = list(transac[income])
         for outcome in transac[income]:
-            outcome_short = outcome[:15]
-            
-            if outcome_short not in successors[income_short]:
-                successors[income_short].append(outcome_short)
-            
-            if outcome_short not in predecessors:
-                predecessors[outcome_short] = []
-            if income_short not in predecessors[outcome_short]:
-                predecessors[outcome_short].append(income_short)
+            if outcome not in predecessors:
+                predecessors[outcome] = []
+            predecessors[outcome].append(income)
     
-    risk_scores = {}
-    for addr in allAddresses:
-        addr_short = addr[:15]
-        risk_scores[addr_short] = calculate_risk_score(
-            addr_short, transac, node_layer, predecessors, successors
-        )
+    risk_scores = calculate_risk_scores(allAddresses, transac, node_layer, args.rules)
     
     print("\n=== Computing layout ===")
     fixed_pos = {}
@@ -194,16 +193,14 @@ def main(args):
     MIN_DR = 150.0
     SPACING_ARC = 60.0
     
-    start_node_short = outcome[:15]
-    fixed_pos[start_node_short] = (0, 0)
+    fixed_pos[outcome] = (0, 0)
     
     layers_nodes = {}
     for addr in allAddresses:
-        node_short = addr[:15]
-        layer = node_layer.get(node_short, 0)
+        layer = node_layer.get(addr, 0)
         if layer not in layers_nodes:
             layers_nodes[layer] = []
-        layers_nodes[layer].append(node_short)
+        layers_nodes[layer].append(addr)
     
     current_radius = 0.0
     
@@ -261,20 +258,19 @@ def main(args):
     added_nodes = set()
     
     for income in transac:
-        income_short = income[:15]
-        if income_short not in added_nodes:
-            layer = node_layer.get(income_short, 0)
-            risk = risk_scores.get(income_short, 0)
-            in_deg = len(predecessors.get(income_short, []))
-            out_deg = len(successors.get(income_short, []))
+        if income not in added_nodes:
+            layer = node_layer.get(income, 0)
+            risk = risk_scores.get(income, 0)
+            in_deg = len(predecessors.get(income, []))
+            out_deg = len(successors.get(income, []))
             
-            graph_data['nodes'][income_short] = {
-                'full_address': income,
+            graph_data['nodes'][income] = {
+                'full_address': address_index.address(income),
                 'layer': layer,
                 'risk_score': risk,
                 'in_degree': in_deg,
                 'out_degree': out_deg,
-                'pos': fixed_pos.get(income_short, (0, 0))
+                'pos': fixed_pos.get(income, (0, 0))
             }
             
             color = COLOR_SCHEMES['circles'][layer % len(COLOR_SCHEMES['circles'])]
@@ -289,36 +285,35 @@ def main(args):
                 'out_degree': out_deg
             }
             
-            if income_short in fixed_pos:
-                node_opts['x'] = fixed_pos[income_short][0]
-                node_opts['y'] = fixed_pos[income_short][1]
+            if income in fixed_pos:
+                node_opts['x'] = fixed_pos[income][0]
+                node_opts['y'] = fixed_pos[income][1]
             
             title_html = f"""
-            <b>{income}</b><br>
+            <b>{address_index.address(income)}</b><br>
             Couche: {layer}<br>
             Score de risque: {risk}/7<br>
             Connexions entrantes: {in_deg}<br>
             Connexions sortantes: {out_deg}
             """
             
-            net.add_node(income_short, label=income_short, title=title_html, **node_opts)
-            added_nodes.add(income_short)
+            net.add_node(income, label=address_index.address(income)[:15], title=title_html, **node_opts)
+            added_nodes.add(income)
         
         for outcome in transac[income]:
-            outcome_short = outcome[:15]
-            if outcome_short not in added_nodes:
-                layer = node_layer.get(outcome_short, 0)
-                risk = risk_scores.get(outcome_short, 0)
-                in_deg = len(predecessors.get(outcome_short, []))
-                out_deg = len(successors.get(outcome_short, []))
+            if outcome not in added_nodes:
+                layer = node_layer.get(outcome, 0)
+                risk = risk_scores.get(outcome, 0)
+                in_deg = len(predecessors.get(outcome, []))
+                out_deg = len(successors.get(outcome, []))
                 
-                graph_data['nodes'][outcome_short] = {
-                    'full_address': outcome,
+                graph_data['nodes'][outcome] = {
+                    'full_address': address_index.address(outcome),
                     'layer': layer,
                     'risk_score': risk,
                     'in_degree': in_deg,
                     'out_degree': out_deg,
-                    'pos': fixed_pos.get(outcome_short, (0, 0))
+                    'pos': fixed_pos.get(outcome, (0, 0))
                 }
                 
                 color = COLOR_SCHEMES['circles'][layer % len(COLOR_SCHEMES['circles'])]
@@ -333,20 +328,20 @@ def main(args):
                     'out_degree': out_deg
                 }
                 
-                if outcome_short in fixed_pos:
-                    node_opts['x'] = fixed_pos[outcome_short][0]
-                    node_opts['y'] = fixed_pos[outcome_short][1]
+                if outcome in fixed_pos:
+                    node_opts['x'] = fixed_pos[outcome][0]
+                    node_opts['y'] = fixed_pos[outcome][1]
                 
                 title_html = f"""
-                <b>{outcome}</b><br>
+                <b>{address_index.address(outcome)}</b><br>
                 Couche: {layer}<br>
                 Score de risque: {risk}/7<br>
                 Connexions entrantes: {in_deg}<br>
                 Connexions sortantes: {out_deg}
                 """
                 
-                net.add_node(outcome_short, label=outcome_short, title=title_html, **node_opts)
-                added_nodes.add(outcome_short)
+                net.add_node(outcome, label=address_index.address(outcome)[:15], title=title_html, **node_opts)
+                added_nodes.add(outcome)
             
             tx_data = transac[income][outcome]
             count = tx_data['count']
@@ -354,14 +349,14 @@ def main(args):
             avg_amount = total_amount / count if count > 0 else 0
             
             graph_data['edges'].append({
-                'from': income_short,
-                'to': outcome_short,
+                'from': income,
+                'to': outcome,
                 'count': count,
                 'total_amount': round(total_amount, 2),
                 'avg_amount': round(avg_amount, 2)
             })
             
-            net.add_edge(income_short, outcome_short, 
+            net.add_edge(income, outcome, 
                         value=count,
                         title=f"Transactions: {count}<br>Montant total: {total_amount:.2f} KAS<br>Moyenne: {avg_amount:.2f} KAS",
                         label=str(count),
@@ -683,7 +678,10 @@ if __name__ == "__main__":
     parser.add_argument("--APIkey", type=str, help="API key", required=True)
     parser.add_argument("--limit", type=int, default=3, help="Limite de transactions")
     parser.add_argument("--nbCercles", type=int, default=3, help="Nombre de cercles")
+    parser.add_argument("--rules", type=str, help="Fichier de règles de risque (section \"pyvis\", défaut : risk_rules.json)")
+    add_archive_args(parser)
     args = parser.parse_args()
+    open_archive_from_args(args)
     
     API_KEY = args.APIkey
     main(args)
\ No newline at end of file
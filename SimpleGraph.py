@@ -1,31 +1,35 @@
-import requests
+from KaspaClient import client
+from KaspaCache import AddressIndex
 import networkx as nx
 import matplotlib.pyplot as plt
 import argparse
 from pyvis.network import Network
 
+# Nœuds du graphe = identifiants entiers des adresses (les préfixes [:15] pouvaient se confondre)
+address_index=AddressIndex()
+
 def make_graph(G,address,limit,allAddresses,transac,addresses=None):
     url=f"https://api.kas.fyi/v1/addresses/{address}/"
     headers = {"x-api-key": API_KEY}
 
-    responseTag=requests.get(url+"tag", headers=headers)
+    responseTag=client.get(url+"tag", headers=headers)
     dataTag=responseTag.json()
 
     if "tag" in dataTag:
         print("Exchange platform",dataTag)
         return G,None,transac
 
-    responseTransac = requests.get(url+"transactions?limit={limit}", headers=headers)
+    responseTransac = client.get(url+"transactions?limit={limit}", headers=headers)
     data=responseTransac.json()
 
     try:
         for transactions in data["transactions"]:
             for input in transactions["inputs"]:
-                incomeAddress=input["previousOutput"]["scriptPublicKeyAddress"]
+                incomeAddress=address_index.id(input["previousOutput"]["scriptPublicKeyAddress"])
                 if incomeAddress not in transac:
                     transac[incomeAddress]={}
                 for output in transactions["outputs"]:
-                    outcomeAddress=output["scriptPublicKeyAddress"]
+                    outcomeAddress=address_index.id(output["scriptPublicKeyAddress"])
                     if outcomeAddress not in transac[incomeAddress]:
                         transac[incomeAddress][outcomeAddress]=1
                     else:
@@ -36,7 +40,7 @@ def make_graph(G,address,limit,allAddresses,transac,addresses=None):
             if income not in addresses and income not in allAddresses:
                 addresses.append(income)
             for outcome in transac[income]:
-                G.add_edge(income[:15],outcome[:15],weight=transac[income][outcome])
+                G.add_edge(income,outcome,weight=transac[income][outcome])
                 if outcome not in addresses and outcome not in allAddresses:
                     addresses.append(outcome)
     except:
@@ -54,7 +58,7 @@ COLOR=[
 
 
 def main(args):
-    outcome=args.address
+    outcome=address_index.id(args.address)
     nb_cercles=args.nbCercles
 
     G=nx.DiGraph()
@@ -69,8 +73,8 @@ def main(args):
         print("Size : ",len(allOutcomes[cercle]))
         for i in range(len(allOutcomes[cercle])):
             colors.append(COLOR[cercle])
-            print(allOutcomes[cercle][i])
-            G,outcomes,transac=make_graph(G,allOutcomes[cercle][i],transac=transac,limit=args.limit,allAddresses=allAddresses)
+            print(address_index.address(allOutcomes[cercle][i]))
+            G,outcomes,transac=make_graph(G,address_index.address(allOutcomes[cercle][i]),transac=transac,limit=args.limit,allAddresses=allAddresses)
             if outcomes is not None:
                 allOutcomes.append(outcomes)
                 allAddresses.extend(outcomes)
@@ -89,6 +93,7 @@ def main(args):
     nx.draw(
         G, pos,
         with_labels=True,
+        labels={node:address_index.address(node)[:15] for node in G},
         node_color=colors,
         node_size=1800,
         font_size=8,
@@ -1,4 +1,6 @@
 import requests
+from KaspaClient import client,add_archive_args,open_archive_from_args,ReplayMissError
+from KaspaCache import AddressIndex
 from pyvis.network import Network
 import argparse
 import math
@@ -12,6 +14,9 @@ DEFAULT_NB_CERCLES = 2
 global API_KEY
 API_KEY = DEFAULT_API_KEY
 
+# Nœuds du graphe = identifiants entiers des adresses (les préfixes [:15] pouvaient se confondre)
+address_index = AddressIndex()
+
 class SimpleGraph:
     def __init__(self):
         self._nodes = set()
@@ -48,10 +53,10 @@ def make_graph(G, address, addresses=None):
     headers = {"x-api-key": API_KEY}
 
     try:
-        response = requests.get(url, headers=headers)
+        response = client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException,ReplayMissError) as e:
         print(f"API Request Failed for {address}: {e}")
         return G, []
     except ValueError:
@@ -87,7 +92,7 @@ def make_graph(G, address, addresses=None):
             addresses.append(income)
             found_addresses.append(income)
         for outcome in transac[income]:
-            G.add_edge(income[:15],outcome[:15],weight=transac[income][outcome])
+            G.add_edge(address_index.id(income),address_index.id(outcome),weight=transac[income][outcome])
             if outcome not in addresses:
                 addresses.append(outcome)
                 found_addresses.append(outcome)
@@ -108,7 +113,9 @@ def main():
     parser.add_argument("--address", type=str, default=DEFAULT_ADDRESS, help="Address Kaspa")
     parser.add_argument("--APIkey", type=str, default=DEFAULT_API_KEY, help="API key")
     parser.add_argument("--nbCercles", type=int, default=DEFAULT_NB_CERCLES, help="Nombre de cercles")
+    add_archive_args(parser)
     args = parser.parse_args()
+    open_archive_from_args(args)
 
     start_addr = args.address
     nb_cercles = args.nbCercles
@@ -125,15 +132,15 @@ def main():
     G = SimpleGraph()
     
     # Initialization
-    start_node_short = start_addr[:15]
-    G.add_node(start_node_short)
+    start_node = address_index.id(start_addr)
+    G.add_node(start_node)
     
     # BFS State
     current_check_addrs = [start_addr]
     visited_addrs = {start_addr}
     
     # Store nodes available at each step [step0_nodes, step1_nodes, ...]
-    layers_nodes = [set([start_node_short])]
+    layers_nodes = [set([start_node])]
     
     for i in range(nb_cercles):
         print(f"Fetching Circle {i+1}...")
@@ -164,9 +171,9 @@ def main():
     fixed_pos = {}
     
     # 1. Fix Center (Circle 0)
-    if start_node_short in G:
-        fixed_nodes.add(start_node_short)
-        fixed_pos[start_node_short] = (0, 0)
+    if start_node in G:
+        fixed_nodes.add(start_node)
+        fixed_pos[start_node] = (0, 0)
         
     # 2. Fix Concentric Circles (Layers 1+)
     MIN_R_FIRST = 200.0
@@ -246,7 +253,7 @@ def main():
         else:
              pass
              
-        net.add_node(node, label=node, title=node, **opts)
+        net.add_node(node, label=address_index.address(node)[:15], title=address_index.address(node), **opts)
 
     # Add edges
     for u, v, w in G.edges:
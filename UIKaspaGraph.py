@@ -1,47 +1,212 @@
+import argparse
 import json
 import re
 import os
 
+from KaspaCache import CacheDB
+
+# Same default as NewKaspAPI (KASPA_CACHE_DB lets several tools share one cache)
+CACHE_FILE = os.environ.get("KASPA_CACHE_DB", "transacs_cache.db")
+
+# Edge amounts straight from the NewKaspAPI SQLite cache, for the (from, to) pairs passed as JSON.
+# Senders are the distinct input addresses of a transaction (unresolved inputs fall back to the
+# spent output), each sender is credited with every output to the receiver: same flow model as
+# get_edge_amounts.
+EDGE_AMOUNTS_SQL = '''
+    WITH ui_edges AS (
+        SELECT DISTINCT s.id AS src, d.id AS dst FROM json_each(?) e
+        JOIN addresses s ON s.address = json_extract(e.value, '$[0]')
+        JOIN addresses d ON d.address = json_extract(e.value, '$[1]')
+    ),
+    senders AS (
+        SELECT tx_hash, address_id FROM tx_input WHERE address_id IN (SELECT src FROM ui_edges)
+        UNION
+        SELECT i.tx_hash, p.address_id FROM tx_input i
+        JOIN tx_output p ON p.tx_hash = i.prev_hash AND p.idx = i.prev_idx
+        WHERE i.address_id IS NULL AND p.address_id IN (SELECT src FROM ui_edges)
+    )
+    SELECT sa.address, da.address, SUM(o.amount)
+    FROM senders s
+    JOIN ui_edges e ON e.src = s.address_id
+    JOIN tx_output o ON o.tx_hash = s.tx_hash AND o.address_id = e.dst
+    JOIN addresses sa ON sa.id = e.src
+    JOIN addresses da ON da.id = e.dst
+    GROUP BY e.src, e.dst
+'''
+
+class JSONStream:
+    # Minimal incremental JSON reader: walks the top-level object one value at a time,
+    # keeping only the current chunk in memory.
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def refill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        # Drop what has already been consumed
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace character ('' at end of file)
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.refill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected one of {chars!r}, found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Value cut by the end of the chunk: read more and retry
+                if self.refill():
+                    continue
+                raise
+            if end == len(self.buf) and not self.eof and self.refill():
+                # A number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+def iter_cache(filepath, chunk_size=1 << 20):
+    # Yields (txid, tx) from {"transactions": {"txid": {...}, ...}} without loading the whole file
+    with open(filepath, 'r', encoding='utf-8') as f:
+        stream = JSONStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'transactions':
+                stream.expect('{')
+                if stream.peek() == '}':
+                    stream.expect('}')
+                else:
+                    while True:
+                        txid = stream.value()
+                        stream.expect(':')
+                        yield txid, stream.value()
+                        if stream.expect(',}') == '}':
+                            break
+            else:
+                stream.value()
+            if stream.expect(',}') == '}':
+                return
+
 def load_cache(filepath):
-    print(f"Loading transaction cache from {filepath}...")
+    # Streamed: iterate it once per pass, memory stays at one transaction + one chunk
+    print(f"Streaming transaction cache from {filepath}...")
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # The structure is {"transactions": { "txid": {...}, ... }}
-            return data.get('transactions', {})
+        yield from iter_cache(filepath)
     except Exception as e:
         print(f"Error loading cache: {e}")
-        return {}
 
-def get_edge_amounts(transactions):
+def get_edge_amounts_db(cache_path, pairs):
+    # Only the pairs drawn in the HTML are aggregated; rows are streamed from the cursor
+    print(f"Calculating edge amounts from SQLite cache {cache_path}...")
+    edge_amounts = {}
+    with CacheDB(cache_path, readonly=True) as db:
+        for s, r, amount in db.query(EDGE_AMOUNTS_SQL, (json.dumps(sorted(pairs)),)):
+            edge_amounts[(s, r)] = amount
+    return edge_amounts
+
+def outpoint_key(inp):
+    # (previous_outpoint_hash, index) of an input, or None if unusable
+    prev_hash = inp.get('previous_outpoint_hash')
+    # Index might be int or string digit
+    prev_idx = inp.get('previous_outpoint_index')
+    if not prev_hash or prev_idx is None:
+        return None
+    try:
+        return prev_hash, int(prev_idx)
+    except ValueError:
+        return None
+
+def find_unresolved_outpoints(transactions):
+    # First pass: outputs spent by inputs that carry no address. They are the only entries
+    # the fallback lookup needs, so the side index is bounded by this set.
+    needed = set()
+    for _, tx in transactions:
+        for inp in tx.get('inputs') or []:
+            if not (inp.get('previous_outpoint_address') or inp.get('address')):
+                key = outpoint_key(inp)
+                if key:
+                    needed.add(key)
+    return needed
+
+def get_edge_amounts(transactions, pairs=None, needed=None):
+    # transactions: {txid: tx} dict, or a stream of (txid, tx) such as load_cache()
+    # pairs: optional set of (from, to) to keep, e.g. the edges present in the HTML
+    # needed: find_unresolved_outpoints() of the same cache (computed here for a dict)
     print("Calculating edge amounts from transactions...")
+    if isinstance(transactions, dict):
+        transactions = transactions.items()
+        if needed is None:
+            needed = find_unresolved_outpoints(transactions)
+    needed = needed or set()
+    receivers = {r for _, r in pairs} if pairs is not None else None
     # Map (from_addr, to_addr) -> amount_sompi
     edge_amounts = {}
-    
+    # Side index (prev_hash, index) -> address, for needed outpoints only
+    outpoints = {}
+    # Transactions spending an output that comes later in the stream: settled at the end
+    pending = []
+
+    def add_flows(senders, outputs):
+        # Attribute flow: Assume All Senders -> All Outputs
+        # Aggregation logic: Sum up the amounts destined for each receiver
+        # This simplifies the flow model but works for "Volume transferred to X"
+        for s in senders:
+            for r, amt in outputs:
+                pair = (s, r)
+                if pairs is not None and pair not in pairs:
+                    continue
+                if pair not in edge_amounts:
+                    edge_amounts[pair] = 0
+                edge_amounts[pair] += amt
+
     count = 0
-    for tx in transactions.values():
+    for txid, tx in transactions:
         count += 1
+        if needed and tx.get('outputs'):
+            for idx, out in enumerate(tx['outputs']):
+                if (txid, idx) in needed:
+                    outpoints[(txid, idx)] = out.get('script_public_key_address')
+
         senders = set()
+        unresolved = []
         if tx.get('inputs'):
             for inp in tx['inputs']:
                 # The field for address in inputs might be 'previous_outpoint_address' 
                 # or just 'address'. If None, look up the previous transaction.
                 addr = inp.get('previous_outpoint_address') or inp.get('address')
-                
-                if not addr and 'previous_outpoint_hash' in inp:
+
+                if not addr:
                     # Fallback: Resolve via previous transaction
-                    prev_hash = inp['previous_outpoint_hash']
-                    # Index might be int or string digit
-                    prev_idx = inp.get('previous_outpoint_index')
-                    
-                    if prev_hash in transactions and prev_idx is not None:
-                        try:
-                            prev_idx = int(prev_idx)
-                            prev_tx = transactions[prev_hash]
-                            if prev_tx.get('outputs') and len(prev_tx['outputs']) > prev_idx:
-                                addr = prev_tx['outputs'][prev_idx].get('script_public_key_address')
-                        except (ValueError, IndexError):
-                            pass
+                    key = outpoint_key(inp)
+                    if key in outpoints:
+                        addr = outpoints[key]
+                    elif key in needed:
+                        unresolved.append(key)
 
                 if addr:
                     senders.add(addr)
@@ -53,6 +218,8 @@ def get_edge_amounts(transactions):
                 # The field for address in outputs might be 'script_public_key_address'
                 addr = out.get('script_public_key_address') or out.get('address')
                 amt = out.get('amount')
+                if receivers is not None and addr not in receivers:
+                    continue
                 if addr and amt is not None:
                     # amount is string or int in JSON? Usually string in Kaspa JSONs to avoid overflow, or int.
                     # We cast to int safely.
@@ -60,20 +227,21 @@ def get_edge_amounts(transactions):
                         outputs.append((addr, int(amt)))
                     except:
                         pass
-        
-        # Attribute flow: Assume All Senders -> All Outputs
-        # Aggregation logic: Sum up the amounts destined for each receiver
-        # This simplifies the flow model but works for "Volume transferred to X"
-        for s in senders:
-            for r, amt in outputs:
-                pair = (s, r)
-                if pair not in edge_amounts:
-                    edge_amounts[pair] = 0
-                edge_amounts[pair] += amt
+
+        if unresolved and outputs:
+            pending.append((senders, unresolved, outputs))
+        else:
+            add_flows(senders, outputs)
                 
         if count % 1000 == 0:
             print(f"Processed {count} transactions...")
-            
+
+    for senders, unresolved, outputs in pending:
+        senders.update(addr for addr in (outpoints.get(key) for key in unresolved) if addr)
+        add_flows(senders, outputs)
+
+    if count == 0:
+        print("No transactions loaded. Cannot calculate amounts.")
     return edge_amounts
 
 def format_amount(sompi):
@@ -90,31 +258,14 @@ def format_amount(sompi):
     else:
         return f"{kas:.2f} KAS"
 
-def main(filename):
+def main(filename, cache_path=CACHE_FILE):
     print(f"Processing Graph HTML: {filename}")
-    
-    # 1. Load Transaction Cache
-    # Assumes valid cache file in current directory or absolute path
-    cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transaction_cache.txt")
-    if not os.path.exists(cache_path):
-        print(f"Cache file not found at {cache_path}")
-        # Try current working directory
-        cache_path = "transaction_cache.txt"
-    
-    transactions = load_cache(cache_path)
-    if not transactions:
-        print("No transactions loaded. Cannot calculate amounts.")
-        # Proceeding anyway? We might want to just proceed with 0 amounts to not break the tool 
-        # but the user asked us to use the cache.
-    
-    edge_map = get_edge_amounts(transactions)
-    print(f"Calculated amounts for {len(edge_map)} edges.")
 
-    # 2. Read HTML Content
+    # 1. Read HTML Content
     with open(filename, 'r', encoding='utf-8') as f:
         html_content = f.read()
 
-    # 3. Find and Parse 'edges' variable in HTML
+    # 2. Find and Parse 'edges' variable in HTML
     # We look for: edges = new vis.DataSet([...]);
     # Using specific regex keying on the variable name "edges"
     pattern = r'(edges\s*=\s*new\s+vis\.DataSet\(\s*)(\[.*?\])(\s*\);)'
@@ -131,7 +282,21 @@ def main(filename):
     except json.JSONDecodeError as e:
         print(f"ERROR: Failed to parse edges JSON from HTML: {e}")
         return
-        
+
+    # 3. Edge amounts, restricted to the edges drawn in the HTML
+    # SQLite cache maintained by NewKaspAPI; a .txt/.json path is read as a legacy JSON dump
+    pairs = {(edge.get('from'), edge.get('to')) for edge in edges_data}
+    if not os.path.exists(cache_path):
+        print(f"Cache file not found at {cache_path}. Amounts will be 0.")
+        edge_map = {}
+    elif cache_path.endswith(('.txt', '.json')):
+        # Two streamed passes: outpoints the fallback needs, then the amounts
+        needed = find_unresolved_outpoints(load_cache(cache_path))
+        edge_map = get_edge_amounts(load_cache(cache_path), pairs, needed)
+    else:
+        edge_map = get_edge_amounts_db(cache_path, pairs)
+    print(f"Calculated amounts for {len(edge_map)} edges.")
+
     # 4. Enrich edges with Amounts and IDs
     for i, edge in enumerate(edges_data):
         # Assign ID for VisJS update mechanism
@@ -353,6 +518,9 @@ def main(filename):
     print(f"Success! Saved modified interface to: {final_output}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add amount labels, layer filters and popups to a graph HTML")
     # Default input file as requested
-    file_input = "NewAPIGraph_cercle4.html"
-    main(file_input)
\ No newline at end of file
+    parser.add_argument("file", nargs="?", default="NewAPIGraph_cercle4.html", help="Graph HTML to enrich")
+    parser.add_argument("--cache", default=CACHE_FILE, help="SQLite cache from NewKaspAPI (or a legacy transaction_cache.txt JSON dump)")
+    args = parser.parse_args()
+    main(args.file, args.cache)
\ No newline at end of file
@@ -0,0 +1,132 @@
+import argparse
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import parse_qs,urlsplit
+
+# Bouchon local de l'API Kaspa (tests, essais hors ligne) : un historique synthétique et
+# déterministe servi sur les seules routes utilisées par NewKaspAPI. À brancher avec
+# KASPA_API_URL=<url> (workers compris), ou en lançant `python tests/fake_api.py --port 8765`.
+
+SOMPI=100000000
+
+
+def address(k):
+    return f"kaspa:q{k:03d}"+"x"*58
+
+
+def make_chain(nb_addresses=30,nb_transacs=300,seed=1,nb_named=2,unresolved=0.3):
+    # Chaque entrée dépense une sortie antérieure ; une part `unresolved` des entrées est servie
+    # sans adresse ni montant d'origine (à résoudre par /transactions/search)
+    rng=random.Random(seed)
+    addresses=[address(k) for k in range(nb_addresses)]
+    transacs=[]
+    unspent=[]
+    for t in range(nb_transacs):
+        inputs=[]
+        for _ in range(rng.randint(1,2) if len(unspent)>10 else 0):
+            prev_hash,idx,addr,amount=unspent.pop(rng.randrange(len(unspent)))
+            inputs.append({"previous_outpoint_hash":prev_hash,"previous_outpoint_index":str(idx),
+                           "previous_outpoint_address":addr,"previous_outpoint_amount":amount})
+        transac_hash=f"{t:064x}"
+        outputs=[]
+        for idx,addr in enumerate(rng.sample(addresses,rng.randint(1,3))):
+            amount=int(rng.choice([10,20,100,3,0.5,rng.uniform(0,50)])*SOMPI)
+            outputs.append({"index":idx,"amount":amount,"script_public_key_address":addr})
+            unspent.append((transac_hash,idx,addr,amount))
+        transacs.append({"hash":transac_hash,"block_time":1700000000000+t*1000,"inputs":inputs,"outputs":outputs})
+    served=json.loads(json.dumps(transacs))
+    for transac in served:
+        for input in transac["inputs"]:
+            if rng.random()<unresolved:
+                del input["previous_outpoint_address"],input["previous_outpoint_amount"]
+    names={addr:f"Exchange {k}" for k,addr in enumerate(rng.sample(addresses[1:],nb_named))}
+    return transacs,served,names
+
+
+class FakeKaspaAPI:
+    """Serveur HTTP (un thread par requête) qui sert make_chain() comme api.kaspa.org."""
+
+    def __init__(self,port=0,**chain):
+        self.transacs,self.served,self.names=make_chain(**chain)
+        self.by_hash={transac["hash"]:transac for transac in self.served}
+        # Historique de chaque adresse, du plus récent au plus ancien
+        self.history={}
+        for full,transac in zip(reversed(self.transacs),reversed(self.served)):
+            addrs={i["previous_outpoint_address"] for i in full["inputs"]}|{o["script_public_key_address"] for o in full["outputs"]}
+            for addr in addrs:
+                self.history.setdefault(addr,[]).append(transac)
+        self.calls=0
+        self.lock=threading.Lock()
+        self.server=ThreadingHTTPServer(("127.0.0.1",port),Handler)
+        self.server.api=self
+        self.url=f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread=None
+
+    def start(self):
+        self.thread=threading.Thread(target=self.server.serve_forever,daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,exc_type,exc,tb):
+        self.stop()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self,*args):
+        pass
+
+    def send(self,data,status=200):
+        body=json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self):
+        with self.server.api.lock:
+            self.server.api.calls+=1
+
+    def do_GET(self):
+        self.count()
+        api=self.server.api
+        url=urlsplit(self.path)
+        query=parse_qs(url.query)
+        match=re.fullmatch(r"/addresses/([^/]+)/name",url.path)
+        if match:
+            name=api.names.get(match.group(1))
+            return self.send({"address":match.group(1),"name":name} if name else {"detail":"Address name not found"},200 if name else 404)
+        match=re.fullmatch(r"/addresses/([^/]+)/full-transactions",url.path)
+        if match:
+            limit=int(query.get("limit",["50"])[0])
+            offset=int(query.get("offset",["0"])[0])
+            return self.send(api.history.get(match.group(1),[])[offset:offset+limit])
+        self.send({"detail":"Not Found"},404)
+
+    def do_POST(self):
+        self.count()
+        api=self.server.api
+        if urlsplit(self.path).path!="/transactions/search":
+            return self.send({"detail":"Not Found"},404)
+        ids=json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))) or b"{}").get("transactionIds",[])
+        self.send([api.by_hash[h] for h in ids if h in api.by_hash])
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Bouchon local de l'API Kaspa")
+    parser.add_argument("--port",type=int,default=8765)
+    parser.add_argument("--seed",type=int,default=1)
+    args=parser.parse_args()
+    api=FakeKaspaAPI(args.port,seed=args.seed)
+    print(f"KASPA_API_URL={api.url} (adresse initiale : {address(0)})")
+    api.server.serve_forever()
@@ -0,0 +1,39 @@
+from KaspaCache import AddressIndex,CacheDB,written_table
+
+
+def test_rollback_forgets_uncommitted_address_ids(tmp_path):
+    db=CacheDB(str(tmp_path/"cache.db"))
+    db.setup=lambda:db.execute('CREATE TABLE IF NOT EXISTS addresses (id INTEGER PRIMARY KEY,address TEXT UNIQUE)')
+    index=AddressIndex(db)
+    with db:
+        kept=index.id("kaspa:qkept")
+        db.flush()
+        index.id("kaspa:qcancelled")
+        db.rollback()
+        assert len(index)==0
+        assert index.id("kaspa:qkept")==kept
+        # l'identifiant annulé est réattribué : il ne doit plus désigner l'ancienne adresse
+        other=index.id("kaspa:qother")
+        assert index.address(other)=="kaspa:qother"
+
+
+def test_written_table():
+    assert written_table("INSERT OR IGNORE INTO tx (hash) VALUES (?)")=="tx"
+    assert written_table("UPDATE address_sync SET synced_at = ?")=="address_sync"
+    assert written_table("DELETE FROM crawl_futur WHERE run_id = ?")=="crawl_futur"
+    assert written_table("SELECT 1 FROM tx") is None
+
+
+def test_queued_rows_until_written(tmp_path):
+    db=CacheDB(str(tmp_path/"cache.db"))
+    db.setup=lambda:db.execute('CREATE TABLE IF NOT EXISTS t (k TEXT PRIMARY KEY,v INTEGER)')
+    with db:
+        db.start_writer()
+        with db.lock:
+            # écrivain bloqué : l'écriture reste en file
+            db.write('INSERT INTO t (k,v) VALUES (?,?)',("a",1),overlay={"a":1})
+            assert db.queued("a")==1
+            assert db.dirty=={"t":1}
+        db.flush()
+        assert db.queued("a") is None and db.dirty=={}
+        assert db.execute('SELECT v FROM t WHERE k = ?',("a",),wait=False).fetchone()==(1,)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from KaspaTaint import MAX_ITERATIONS,propagate,taint_fifo
+
+# 0 -> 1 (10), 1 -> 2 (5), 1 -> 3 (5), 2 -> 3 (5), 3 -> 1 (100) ; adresse initiale : 0
+GRAPH=(4,np.array([0,1,1,2,3]),np.array([1,2,3,3,1]),np.array([10.0,5.0,5.0,5.0,100.0]))
+# Même boucle, avec en plus 4 -> 1 (100) venu d'une source non teintée
+LOOP=(5,np.array([0,4,1,1,2,3]),np.array([1,1,2,3,3,1]),np.array([10.0,100.0,5.0,5.0,5.0,100.0]))
+
+
+def transac(inputs,outputs):
+    return ([{"address":a,"amount":v} for a,v in inputs],[{"address":a,"amount":v} for a,v in outputs])
+
+
+def test_poison_taints_everything_reachable():
+    taint,amount,depth=propagate(*GRAPH,0,"poison")
+    assert taint.tolist()==[1.0,1.0,1.0,1.0]
+    assert amount.tolist()==[0.0,110.0,5.0,10.0]
+    assert depth==2
+
+
+def test_haircut_follows_loops_to_fixed_point():
+    taint,amount,iterations=propagate(*LOOP,0,"haircut")
+    # 1 reçoit 10 teintés de 0, 100 non teintés de 4 et 100 revenus par la boucle 1 -> 2 -> 3 -> 1 :
+    # t1 = (10 + 100 t3) / 210, t2 = t1, t3 = (5 t1 + 5 t2) / 10, d'où t1 = t2 = t3 = 1/11
+    assert taint==pytest.approx([1.0,1/11,1/11,1/11,0.0])
+    assert amount==pytest.approx([0.0,210/11,5/11,10/11,0.0])
+    assert 2<iterations<MAX_ITERATIONS
+
+
+def test_haircut_closed_loop_and_iteration_cap():
+    # Boucle alimentée par la seule adresse initiale : tout finit teinté
+    taint,_,iterations=propagate(*GRAPH,0,"haircut")
+    assert taint==pytest.approx([1.0,1.0,1.0,1.0],abs=1e-7)
+    assert iterations<MAX_ITERATIONS
+    _,_,iterations=propagate(*GRAPH,0,"haircut",max_iterations=5)
+    assert iterations==5
+
+
+def test_propagate_rejects_fifo():
+    with pytest.raises(ValueError):
+        propagate(*GRAPH,0,"fifo")
+
+
+def test_fifo_spends_oldest_funds_first():
+    transacs=[transac([("S",10)],[("A",10)]),
+              transac([("B",10)],[("A",10)]),
+              transac([("A",20)],[("C",15),("D",5)])]
+    result=taint_fifo(transacs,"S")
+    assert result["S"]["taint"]==1.0
+    assert result["A"]==pytest.approx({"taint":0.5,"amount":10.0})
+    # C reçoit d'abord les 10 KAS teintés de A, puis 5 non teintés ; D ne reçoit que du non teinté
+    assert result["C"]==pytest.approx({"taint":2/3,"amount":10.0})
+    assert result["D"]==pytest.approx({"taint":0.0,"amount":0.0})
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import zipfile
+from contextlib import contextmanager
+
+import pytest
+
+import KaspaRules
+import NewKaspAPI
+from KaspaClient import ReplayMissError,client
+from fake_api import FakeKaspaAPI,address
+
+
+@contextmanager
+def http_archive(path,mode):
+    client.open_archive(path,mode)
+    try:
+        yield client.archive
+    finally:
+        client.archive.close()
+        client.archive=None
+
+
+@pytest.fixture
+def cache(tmp_path,monkeypatch):
+    # Cache SQLite propre au test (la connexion du module s'ouvre à la première requête)
+    monkeypatch.setattr(NewKaspAPI.db,"path",str(tmp_path/"cache.db"))
+    yield NewKaspAPI.db
+    NewKaspAPI.db.close()
+    NewKaspAPI.address_index.clear()
+    NewKaspAPI.names_cache.data.clear()
+
+
+def test_replay_miss_is_not_cached_as_unnamed(cache,tmp_path):
+    archive=tmp_path/"empty.zip"
+    zipfile.ZipFile(archive,"w").close()
+    with http_archive(str(archive),"replay"),pytest.raises(ReplayMissError):
+        NewKaspAPI.verify_name("kaspa:qmissing")
+    assert cache.execute('SELECT COUNT(*) FROM names').fetchone()[0]==0
+
+
+def test_legacy_transactions_migrated_then_dropped(cache):
+    # Cache antérieur au schéma normalisé : transactions brutes et résumés en JSON
+    transac={"hash":"cd"*32,"block_time":1700000000123,
+             "inputs":[{"previous_outpoint_hash":"ab"*32,"previous_outpoint_index":"1",
+                        "previous_outpoint_address":"kaspa:qsource","previous_outpoint_amount":1500000000}],
+             "outputs":[{"index":0,"script_public_key_address":"kaspa:qtarget","amount":1000000000},
+                        {"index":1,"script_public_key_address":"kaspa:qsource","amount":499990000}]}
+    conn=sqlite3.connect(cache.path)
+    with conn:
+        conn.execute('CREATE TABLE transactions (transac_hash TEXT PRIMARY KEY,data TEXT)')
+        conn.execute('CREATE TABLE transactions_inout (transac_hash TEXT PRIMARY KEY,inputs TEXT,outputs TEXT)')
+        conn.execute('INSERT INTO transactions VALUES (?,?)',(transac["hash"],json.dumps(transac)))
+    conn.close()
+    ids=NewKaspAPI.address_index.id
+    assert NewKaspAPI.get_inout_db(transac["hash"])==([{"address":ids("kaspa:qsource"),"amount":15}],
+                                                       [{"address":ids("kaspa:qtarget"),"amount":10}])
+    assert NewKaspAPI.get_outpoints_db([transac["hash"]])[(transac["hash"],1)]==("kaspa:qsource",499990000)
+    tables={row[0] for row in cache.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    assert not tables&{"transactions","transactions_inout"}
+
+
+def test_iter_address_inout_pages_by_key(cache,monkeypatch):
+    # block_time égaux d'un lot à l'autre : la clé (block_time, transac_hash) les départage
+    address="kaspa:qpaged"
+    for k,block_time in enumerate([3,2,2,2,1,1]):
+        NewKaspAPI.save_address_transac(address,{"hash":f"{k:064x}","block_time":block_time,"inputs":[],
+                                                 "outputs":[{"index":0,"amount":(k+1)*100000000,"script_public_key_address":address}]})
+    full=list(NewKaspAPI.iter_address_inout(address,0))
+    assert [outputs[0]["amount"] for _,outputs in full]==[1,2,3,4,5,6]
+    monkeypatch.setattr(NewKaspAPI,"PAGE_SIZE",2)
+    assert list(NewKaspAPI.iter_address_inout(address,0))==full
+    assert list(NewKaspAPI.iter_address_inout(address,5))==full[:5]
+
+
+def test_rescored_csr_export_matches_live_scores(cache,tmp_path):
+    # 12 cibles qui ont chacune reçu 100 x 0.1 KAS (cumulés en flottants, comme explore_address)
+    ids=NewKaspAPI.address_index.id
+    address_out={}
+    for k in range(12):
+        amount=0
+        for _ in range(100):
+            amount+=0.1
+        address_out[ids(f"kaspa:qtarget{k}")]={"nb":100,"amount":amount}
+    relations={ids("kaspa:qsource"):{"cercle":0,"amount_in":0,"amount_out":sum(o["amount"] for o in address_out.values()),
+                                     "nb_transacs_in":0,"nb_transacs_out":1200,"address_in":{},"address_out":address_out}}
+    live=NewKaspAPI.risk_scores(relations,2)
+    NewKaspAPI.export_csr(relations,str(tmp_path/"csr"),"kaspa:qsource",2,100)
+    assert KaspaRules.rescore(str(tmp_path/"csr"))=={NewKaspAPI.address_index.address(a):risk for a,risk in live.items()}
+    assert any(risk.startswith("Montants ronds") for risk in live[ids("kaspa:qsource")]["risks"])
+
+
+@pytest.fixture(scope="module")
+def api():
+    with FakeKaspaAPI() as api:
+        yield api
+
+
+@pytest.fixture
+def crawl(api,tmp_path,monkeypatch):
+    # Parcours sur un cache vide (tmp_path/<nom>.db) servi par le bouchon ; rend les relations décodées
+    monkeypatch.setattr(NewKaspAPI,"URLADDRESS",api.url+"/addresses/")
+    monkeypatch.setattr(NewKaspAPI,"URLTRANSAC",api.url+"/transactions/")
+    monkeypatch.setitem(client.rate_limits,"127.0.0.1",(1000,1000))
+    monkeypatch.setenv("KASPA_API_URL",api.url)
+    def run(name,fn,*args):
+        path=str(tmp_path/f"{name}.db")
+        monkeypatch.setattr(NewKaspAPI.db,"path",path)
+        monkeypatch.setenv("KASPA_CACHE_DB",path)
+        NewKaspAPI.db.start_writer()
+        try:
+            return NewKaspAPI.decode_relations(fn(address(0),*args))
+        finally:
+            NewKaspAPI.db.close()
+            NewKaspAPI.address_index.clear()
+            NewKaspAPI.names_cache.data.clear()
+    return run
+
+
+@pytest.mark.parametrize("limit,page_size",[(10,100),(0,3)])
+def test_concurrent_prefetch_matches_sequential(crawl,monkeypatch,limit,page_size):
+    # page_size : taille des pages remises par les threads du préchargement au thread principal
+    monkeypatch.setattr(NewKaspAPI,"PAGE_SIZE",page_size)
+    sequential=crawl("sequential",NewKaspAPI.crawl_bfs,3,limit)
+    assert len(sequential)>10
+    assert crawl("concurrent",NewKaspAPI.crawl_bfs,3,limit,4)==sequential
+
+
+def test_distributed_matches_sequential_and_replays(crawl,api,tmp_path):
+    sequential=crawl("sequential",NewKaspAPI.crawl_bfs,3,10)
+    archive=str(tmp_path/"run.zip")
+    with http_archive(archive,"record"):
+        assert crawl("distributed",NewKaspAPI.crawl_distributed,3,10,2)==sequential
+    # les archives des workers ont été fusionnées : le parcours se rejoue sans appel à l'API
+    calls=api.calls
+    with http_archive(archive,"replay"):
+        assert crawl("replayed",NewKaspAPI.crawl_distributed,3,10,2)==sequential
+    assert api.calls==calls